@@ -1,10 +1,13 @@
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from pypylon import pylon
+from pypylon import pylon, genicam
 import threading
 import numpy as np
 from utils.logger import Logger, set_global_log_level_by_name
+from core.scheduling import apply_scheduling, numa_local, JitterMonitor
+from core.pretrigger import PreTriggerRing
+from core.processing_workers import PIXEL_FORMATS, PIXEL_FORMAT_BAYER_RG12, PIXEL_FORMAT_BAYER_RG12P
 import cv2
 import time
 from line_profiler import profile
@@ -18,28 +21,112 @@ os.environ["PYLON_CAMEMU"] = "1"
 logger = Logger(__name__)
 set_global_log_level_by_name("INFO")
 
+# pylon's PixelType of a grab result -> our pixel format names
+PIXEL_TYPES = {getattr(pylon, f"PixelType_{pixel_format}"): pixel_format for pixel_format in PIXEL_FORMATS}
+
+
+
+      
+''' Pylon event handlers
+    Forward pylon's callbacks (called on pylon's grab loop thread) to the CamManager
+'''
+class _GrabEventHandler(pylon.ImageEventHandler):
+    def __init__(self, cam_manager):
+        super().__init__()
+        self._cam_manager = cam_manager
+
+    def OnImageGrabbed(self, camera, grabResult):
+        self._cam_manager._on_image_grabbed(grabResult)
+
+    def OnImagesSkipped(self, camera, countOfSkippedImages):
+        self._cam_manager._on_images_skipped(countOfSkippedImages)
+
+
+class _DeviceEventHandler(pylon.ConfigurationEventHandler):
+    def __init__(self, cam_manager):
+        super().__init__()
+        self._cam_manager = cam_manager
+
+    def OnCameraDeviceRemoved(self, camera):
+        self._cam_manager._on_device_removed()
+
+    def OnGrabError(self, camera, errorMessage):
+        logger.error(f"Grab error: {errorMessage}")
 
 
       
 ''' CamManager class 
     This class is used to manage/connect to Basler Cameras
+    Frames are delivered by pylon's grab loop thread through _GrabEventHandler;
+    a watchdog thread restarts grabbing after frame timeouts and reconnects
+    after device removal, while the FrameBuffer and workers keep running.
 ''' 
 class CamManager:
-    def __init__(self, frame_buffer):
+    def __init__(self, frame_buffer, grab_scheduling=None, frame_timeout=2.0, watchdog_interval=0.1, pixel_format=PIXEL_FORMAT_BAYER_RG12):
         self.tl_factory = pylon.TlFactory.GetInstance()
         self.devices = self.tl_factory.EnumerateDevices()
         self.current_cam = None
+        self._current_index = None
+        self._current_serial = None
+
+        self._grab_handler = _GrabEventHandler(self)
+        self._device_handler = _DeviceEventHandler(self)
 
-        self._capture_thread = None
+        # watchdog: short, cancellable waits so stop never blocks for long
+        self._watchdog_thread = None
         self._stop_event = threading.Event()
+        self._frame_timeout = frame_timeout
+        self._watchdog_interval = watchdog_interval
+        self._device_removed = threading.Event()
+        self._last_frame_time = 0.0
 
         self._frame_count = 0
+        self._skipped_count = 0
+        self._grab_thread_configured = False
+
+        # serializes grab restarts (watchdog) and AOI changes (tracking)
+        self._camera_lock = threading.RLock()
+        self._tracking = None
 
+        # latency of the last stop_capture / switch_camera in ms
+        self.last_stop_latency_ms = None
+        self.last_switch_latency_ms = None
+        self._switch_thread = None
 
         self._width = None
         self._height = None
 
         self.frame_buffer = frame_buffer
+        self.pre_trigger_ring = None
+        self._pre_trigger_args = None
+
+        # applied on every start_capture and again after reconnecting
+        self._exposure_time = 100
+        self._gain = 0
+
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Invalid pixel format: {pixel_format}")
+        # checked against the camera's PixelFormat on connect and start_capture
+        self._pixel_format = pixel_format
+
+        # SchedulingConfig for the grab thread (cpu pinning, nice, rt priority)
+        self.grab_scheduling = grab_scheduling
+        self.grab_jitter = JitterMonitor("grab")
+
+        metrics = frame_buffer.metrics
+        # the grab thread updates frame buffer metrics that other threads of this process also touch
+        self._grab_metrics_shard = metrics.allocate_shard()
+        self._frames_metric = metrics.counter("collimate_camera_frames_total", "Frames grabbed successfully")
+        self._failed_metric = metrics.counter("collimate_camera_grab_failures_total", "Failed grab results")
+        self._skipped_metric = metrics.counter("collimate_camera_frames_skipped_total", "Frames skipped by the LatestImageOnly strategy")
+        self._recoveries_metric = metrics.counter("collimate_camera_recoveries_total", "Grab restarts after timeouts or device removal")
+        self._interval_metric = metrics.histogram("collimate_camera_frame_interval_seconds", "Time between grabbed frames",
+                                                  buckets=(0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1, 0.25, 1.0))
+        self._stop_latency_metric = metrics.gauge("collimate_camera_stop_latency_seconds", "Duration of the last stop_capture")
+        self._aoi_width_metric = metrics.gauge("collimate_camera_aoi_width", "Current AOI width in pixels")
+        self._aoi_height_metric = metrics.gauge("collimate_camera_aoi_height", "Current AOI height in pixels")
+        self._frame_rate_metric = metrics.gauge("collimate_camera_frame_rate", "Configured acquisition frame rate")
+        self._aoi_changes_metric = metrics.counter("collimate_camera_aoi_changes_total", "AOI resizes and re-centerings by the tracking mode")
         
 
 
@@ -60,7 +147,12 @@ class CamManager:
             self.current_cam.Close()
 
         self.current_cam = pylon.InstantCamera(self.tl_factory.CreateDevice(self.devices[index]))
+        self.current_cam.RegisterImageEventHandler(self._grab_handler, pylon.RegistrationMode_Append, pylon.Cleanup_None)
+        self.current_cam.RegisterConfiguration(self._device_handler, pylon.RegistrationMode_Append, pylon.Cleanup_None)
         self.current_cam.Open()
+        self._current_index = index
+        self._current_serial = self.devices[index].GetSerialNumber()
+        self._device_removed.clear()
         #check if camera is emulated
         if self.current_cam.GetDeviceInfo().GetModelName() == "Emulation":
             logger.warning("Camera is emulated")
@@ -72,8 +164,12 @@ class CamManager:
             self.current_cam.AcquisitionFrameRateEnable.Value = True
             self.current_cam.AcquisitionFrameRate.Value = 55
 
+            if self._pixel_format not in self.current_cam.PixelFormat.Symbolics:
+                logger.warning(f"Camera does not support pixel format {self._pixel_format}, select another one before capturing")
             return
         logger.info(f"Connected to camera: {self.current_cam.GetDeviceInfo().GetModelName()}")  
+        if self._pixel_format not in self.current_cam.PixelFormat.Symbolics:
+            logger.warning(f"Camera does not support pixel format {self._pixel_format}, select another one before capturing")
         
 
     def disconnect(self):
@@ -88,64 +184,433 @@ class CamManager:
         #self.clear_all_callbacks()
         
         # Close camera
-        if self.current_cam and self.current_cam.IsOpen():
-            self.current_cam.Close()
+        if self.current_cam:
+            if self.current_cam.IsOpen():
+                self.current_cam.Close()
+            self.current_cam.DestroyDevice()
         self.current_cam = None
         logger.info("Disconnected from camera")
 
+    def switch_camera(self, index: int):
+        '''
+        Switch to another camera, keeping capture running if it was.
+        The FrameBuffer and workers are untouched.
+        '''
+        start = time.perf_counter()
+        was_capturing = self.is_capturing()
+        self.disconnect()
+        self.connect(index)
+        if was_capturing:
+            self.start_capture()
+        self.last_switch_latency_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Switched to camera {index} in {self.last_switch_latency_ms:.1f} ms")
+
+    def switch_camera_async(self, index: int, on_done=None):
+        '''
+        Run switch_camera on a background thread, so GUI callbacks return right away.
+        on_done(error) is called from that thread when done (error is None on success).
+        Returns False if a switch is already in progress.
+        '''
+        if self.is_switching():
+            logger.warning("Camera switch already in progress")
+            return False
+
+        def switch():
+            error = None
+            try:
+                self.switch_camera(index)
+            except Exception as e:
+                error = e
+                logger.error(f"Error switching to camera {index}: {e}")
+            if on_done is not None:
+                on_done(error)
+
+        self._switch_thread = threading.Thread(target=switch, name="CameraSwitch", daemon=True)
+        self._switch_thread.start()
+        return True
+
+    def is_switching(self):
+        return self._switch_thread is not None and self._switch_thread.is_alive()
+
     def start_capture(self):
         if not self.current_cam or not self.current_cam.IsOpen():
             raise RuntimeError("Camera is not connected")
         if self.current_cam.IsGrabbing():
             raise RuntimeError("Camera is already capturing")
 
-        self.set_exposure_time(100)
-        self.set_gain(0)
-        self.current_cam.PixelFormat.Value = "BayerRG12"
-       
-        self.current_cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
-        logger.info(f"Grab started successfully. Camera grabbing: {self.current_cam.IsGrabbing()}")
-        
+        self._configure_camera()
+
         self._stop_event.clear()
         self._frame_count = 0
+        self._skipped_count = 0
         self._gpu_failure_count = 0  # Track GPU failures
         self._max_gpu_failures = 3  # Switch to CPU after 3 failures
-        self._capture_thread = threading.Thread(target=self._callback_thread)
-        self._capture_thread.start()
+        self._start_grabbing()
+        logger.info(f"Grab started successfully. Camera grabbing: {self.current_cam.IsGrabbing()}")
+
+        self._watchdog_thread = threading.Thread(target=self._watchdog, name="GrabWatchdog", daemon=True)
+        self._watchdog_thread.start()
         logger.info("Started capturing")
 
+    def _configure_camera(self):
+        '''
+        Apply the capture settings (exposure, gain, pixel format, tracking AOI);
+        used by start_capture and again after reconnecting to a removed camera
+        '''
+        self._check_pixel_format(self._pixel_format)
+        self.set_exposure_time(self._exposure_time)
+        self.set_gain(self._gain)
+        self.current_cam.PixelFormat.Value = self._pixel_format
+        tracking = self._tracking
+        if tracking and tracking["active"]:
+            self._apply_aoi(*tracking["aoi"])
+            self._raise_frame_rate()
+
+    def _start_grabbing(self):
+        self._last_frame_time = time.perf_counter()
+        # every StartGrabbing runs a new pylon grab loop thread, configure it on its first frame
+        self._grab_thread_configured = False
+        # allocate the grab buffers on the grab thread's NUMA node
+        with numa_local(self.grab_scheduling):
+            self.current_cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly, pylon.GrabLoop_ProvidedByInstantCamera)
+
     def stop_capture(self):
         '''
         Stop capturing
         '''
-        if self._capture_thread and self._capture_thread.is_alive():
+        if self._watchdog_thread and self._watchdog_thread.is_alive():
+            start = time.perf_counter()
             self._stop_event.set()  
-            self._capture_thread.join()
-            self._capture_thread = None
-            self.current_cam.StopGrabbing()
-            logger.info("Stopped capturing")
+            self._watchdog_thread.join()
+            self._watchdog_thread = None
+            if self.current_cam:
+                self.current_cam.StopGrabbing()
+            self.frame_buffer.flush_raw()
+            self.last_stop_latency_ms = (time.perf_counter() - start) * 1000
+            self._stop_latency_metric.set(self.last_stop_latency_ms / 1000)
+            logger.info(f"Stopped capturing in {self.last_stop_latency_ms:.1f} ms")
 
-    def _callback_thread(self):
+    # ---- grab engine (called on pylon's grab loop thread) ----
+
+    def _on_image_grabbed(self, grabResult):
+        if not self._grab_thread_configured:
+            apply_scheduling(self.grab_scheduling)
+            self.frame_buffer.metrics.bind_thread_shard(self._grab_metrics_shard)
+            self._grab_thread_configured = True
+
+        if grabResult.GrabSucceeded():
+            now = time.perf_counter()
+            if self._frame_count:
+                self._interval_metric.observe(now - self._last_frame_time)
+            self._last_frame_time = now
+            self._frame_count += 1
+            self._frames_metric.inc()
+            self.grab_jitter.tick()
+            # the format of this very buffer, not the one we asked for
+            pixel_format = PIXEL_TYPES.get(grabResult.GetPixelType())
+            if pixel_format is None:
+                self._failed_metric.inc()
+                logger.warning(f"Unsupported pixel type {grabResult.GetPixelType()}, frame dropped")
+                return
+            if pixel_format == PIXEL_FORMAT_BAYER_RG12P:
+                # packed rows as they came over the link, the workers unpack them
+                frame = np.frombuffer(grabResult.GetBuffer(), dtype=np.uint8).reshape(grabResult.GetHeight(), -1)
+                frame = frame[:, :grabResult.GetWidth() * 3 // 2]
+            else:
+                frame = grabResult.GetArray()
+            # the AOI can move between frames, take the offset of this very frame
+            offset = (grabResult.GetOffsetX(), grabResult.GetOffsetY())
+            ring = self.pre_trigger_ring
+            if ring is not None and frame.dtype == ring.dtype:
+                ring.push(frame, self.frame_buffer.raw_frame_ctr.value, offset=offset)
+            self.frame_buffer.put_raw_frame(frame, offset, pixel_format)
+        else:
+            self._failed_metric.inc()
+            logger.warning(f"Grab failed: {grabResult.GetErrorDescription()}")
+
+    def _on_images_skipped(self, count):
+        self._skipped_count += count
+        self._skipped_metric.inc(count)
+
+    def _on_device_removed(self):
+        logger.error("Camera device removed")
+        self._device_removed.set()
+
+    def _watchdog(self):
         '''
-        Thread to handle the callback from the camera
-        Measures the time between loops and logs it in ms and FPS.        '''
-        
-        while not self._stop_event.is_set():
+        Supervises the grab loop with short, cancellable waits:
+        restarts grabbing when no frame arrived within frame_timeout and
+        reconnects to the same camera (by serial) after device removal.
+        '''
+        while not self._stop_event.wait(self._watchdog_interval):
+            try:
+                if self._device_removed.is_set():
+                    self._recover_device()
+                elif time.perf_counter() - self._last_frame_time > self._frame_timeout:
+                    logger.warning(f"No frame within {self._frame_timeout:.1f} s, restarting grab")
+                    self._recoveries_metric.inc()
+                    with self._camera_lock:
+                        self.current_cam.StopGrabbing()
+                        self._start_grabbing()
+            except Exception as e:
+                logger.error(f"Grab watchdog error: {e}")
+
+    def _recover_device(self):
+        with self._camera_lock:
+            try:
+                self.current_cam.StopGrabbing()
+            except Exception:
+                pass
+            self.current_cam.DestroyDevice()
 
-            grabResult = self.current_cam.RetrieveResult(5000)
-            if grabResult.GrabSucceeded():                
-                self.frame_buffer.put_raw_frame(grabResult.GetArray())
-                
-            grabResult.Release()
+        while not self._stop_event.is_set():
+            for index, model, serial in self.list_cameras():
+                if serial == self._current_serial:
+                    # current_cam is replaced here, keep AOI and frame rate changes out meanwhile
+                    with self._camera_lock:
+                        self.connect(index)
+                        # a reconnected camera starts from its defaults
+                        self._configure_camera()
+                        self._start_grabbing()
+                    self._recoveries_metric.inc()
+                    logger.info(f"Reconnected to camera {serial}")
+                    return
+            self._stop_event.wait(0.5)
     
 
+    # ---- pre-trigger recording ----
+
+    def enable_pre_trigger(self, pre_seconds=1.0, post_seconds=0.5, memory_budget_mb=1024, output_dir="recordings"):
+        '''
+        Keep the last pre_seconds of raw frames in memory; trigger_dump() writes
+        the frames from pre_seconds before to post_seconds after the trigger to disk
+        '''
+        if not self.is_connected():
+            raise RuntimeError("Camera is not connected")
+        self._pre_trigger_args = {"pre_seconds": pre_seconds, "post_seconds": post_seconds,
+                                  "memory_budget_mb": memory_budget_mb, "output_dir": output_dir}
+        # slots are sized for the full frame, tracking AOI frames fit into them
+        width, height = self._tracking["full_aoi"][:2] if self._tracking else self.get_resolution()
+        fps = self.current_cam.AcquisitionFrameRate.GetValue()
+        # raw frames are stored as they arrive, packed formats keep their smaller slots
+        if self._pixel_format == PIXEL_FORMAT_BAYER_RG12P:
+            shape, dtype = (height, width * 3 // 2), np.uint8
+        elif self._pixel_format.endswith("8"):
+            shape, dtype = (height, width), np.uint8
+        else:
+            shape, dtype = (height, width), np.uint16
+        # allocate the ring on the grab thread's NUMA node
+        with numa_local(self.grab_scheduling):
+            self.pre_trigger_ring = PreTriggerRing(shape, dtype, fps, pre_seconds, post_seconds, memory_budget_mb, output_dir,
+                                                   external_trigger=self.frame_buffer.trigger_event)
+        return self.pre_trigger_ring
+
+    def disable_pre_trigger(self):
+        self.pre_trigger_ring = None
+        self._pre_trigger_args = None
+
+    def trigger_dump(self, reason="manual"):
+        '''
+        Dump the frames around now to disk (see enable_pre_trigger)
+        '''
+        if self.pre_trigger_ring is None:
+            raise RuntimeError("Pre-trigger recording is not enabled")
+        return self.pre_trigger_ring.trigger(reason)
+
+    # ---- tracking AOI ----
+
+    def enable_tracking_aoi(self, width, height, recenter_margin=0.25, lost_after=10, max_fps=None):
+        '''
+        Track the target with a width x height AOI and raise the frame rate to what
+        the smaller AOI allows (capped at max_fps). Feed the target position with
+        update_tracking(); the current (full) AOI is restored when the target is lost.
+        '''
+        if not self.is_connected():
+            raise RuntimeError("Camera is not connected")
+        cam = self.current_cam
+        self._tracking = {
+            "size": (width, height),
+            "recenter_margin": recenter_margin,
+            "lost_after": lost_after,
+            "max_fps": max_fps,
+            "lost": 0,
+            "active": False,
+            "full_aoi": (cam.Width.GetValue(), cam.Height.GetValue(), cam.OffsetX.GetValue(), cam.OffsetY.GetValue()),
+            "full_frame_rate": (cam.AcquisitionFrameRateEnable.GetValue(), cam.AcquisitionFrameRate.GetValue()),
+        }
+        # the AOI as last applied, so update_tracking never reads it back over the link
+        self._tracking["aoi"] = self._tracking["full_aoi"]
+        logger.info(f"Tracking AOI enabled: {width}x{height}, full frame {self._tracking['full_aoi'][:2]}")
+
+    def disable_tracking_aoi(self):
+        if self._tracking and self._tracking["active"]:
+            self._restore_full_frame()
+        self._tracking = None
+
+    def update_tracking(self, target):
+        '''
+        target: (x, y) of the reticle image in sensor coordinates, i.e. the position in
+        a processed frame plus that frame's outputs["offset"]; None if it was not found
+        '''
+        tracking = self._tracking
+        if tracking is None:
+            return
+        # the watchdog may be replacing current_cam after a device removal; _configure_camera
+        # re-applies the tracking AOI on the new camera, so updates are skipped meanwhile
+        with self._camera_lock:
+            if self._device_removed.is_set():
+                return
+            if target is None:
+                tracking["lost"] += 1
+                if tracking["active"] and tracking["lost"] >= tracking["lost_after"]:
+                    logger.warning("Tracking target lost, back to full frame")
+                    self._restore_full_frame()
+                return
+            tracking["lost"] = 0
+
+            aoi_width, aoi_height = tracking["size"]
+            if not tracking["active"]:
+                self._apply_aoi(aoi_width, aoi_height, *self._centered_offset(target))
+                tracking["active"] = True
+                self._raise_frame_rate()
+                return
+
+            # re-center once the target drifts out of the central part of the AOI
+            x, y = target
+            _, _, offset_x, offset_y = tracking["aoi"]
+            center_x = offset_x + aoi_width / 2
+            center_y = offset_y + aoi_height / 2
+            if abs(x - center_x) > tracking["recenter_margin"] * aoi_width or abs(y - center_y) > tracking["recenter_margin"] * aoi_height:
+                self._move_aoi(*self._centered_offset(target))
+
+    def _centered_offset(self, target):
+        full_width, full_height, full_x, full_y = self._tracking["full_aoi"]
+        aoi_width, aoi_height = self._tracking["size"]
+        offset_x = min(max(target[0] - aoi_width / 2, full_x), full_x + full_width - aoi_width)
+        offset_y = min(max(target[1] - aoi_height / 2, full_y), full_y + full_height - aoi_height)
+        return int(offset_x), int(offset_y)
+
+    @staticmethod
+    def _aligned(node, value):
+        # multiples of the node increment and of 2, so the Bayer phase is kept
+        inc = max(node.GetInc(), 2)
+        value = min(max(int(value), node.GetMin()), node.GetMax())
+        value = value // inc * inc
+        return value if value >= node.GetMin() else value + inc
+
+    def _apply_aoi(self, width, height, offset_x, offset_y):
+        '''
+        Resize the AOI; the camera only accepts new Width/Height while not grabbing
+        '''
+        cam = self.current_cam
+        with self._camera_lock:
+            was_grabbing = cam.IsGrabbing()
+            if was_grabbing:
+                cam.StopGrabbing()
+            # offsets first, so the new size always fits
+            cam.OffsetX.SetValue(cam.OffsetX.GetMin())
+            cam.OffsetY.SetValue(cam.OffsetY.GetMin())
+            cam.Width.SetValue(self._aligned(cam.Width, width))
+            cam.Height.SetValue(self._aligned(cam.Height, height))
+            cam.OffsetX.SetValue(self._aligned(cam.OffsetX, offset_x))
+            cam.OffsetY.SetValue(self._aligned(cam.OffsetY, offset_y))
+            if was_grabbing:
+                self._start_grabbing()
+        if self._tracking:
+            self._tracking["aoi"] = (cam.Width.GetValue(), cam.Height.GetValue(), cam.OffsetX.GetValue(), cam.OffsetY.GetValue())
+        self._aoi_changes_metric.inc()
+        self._aoi_width_metric.set(cam.Width.GetValue())
+        self._aoi_height_metric.set(cam.Height.GetValue())
+        logger.info(f"AOI set to {cam.Width.GetValue()}x{cam.Height.GetValue()} at ({cam.OffsetX.GetValue()}, {cam.OffsetY.GetValue()})")
+
+    def _move_aoi(self, offset_x, offset_y):
+        '''
+        Re-center the AOI; most cameras accept new offsets while grabbing
+        '''
+        cam = self.current_cam
+        if not (genicam.IsWritable(cam.OffsetX) and genicam.IsWritable(cam.OffsetY)):
+            self._apply_aoi(cam.Width.GetValue(), cam.Height.GetValue(), offset_x, offset_y)
+            return
+        with self._camera_lock:
+            cam.OffsetX.SetValue(self._aligned(cam.OffsetX, offset_x))
+            cam.OffsetY.SetValue(self._aligned(cam.OffsetY, offset_y))
+        self._tracking["aoi"] = (cam.Width.GetValue(), cam.Height.GetValue(), cam.OffsetX.GetValue(), cam.OffsetY.GetValue())
+        self._aoi_changes_metric.inc()
+
+    def _raise_frame_rate(self):
+        '''
+        Run as fast as the current AOI allows (capped at the tracking max_fps)
+        '''
+        cam = self.current_cam
+        with self._camera_lock:
+            cam.AcquisitionFrameRateEnable.SetValue(False)
+            rate = cam.AcquisitionFrameRate.GetMax()
+            # the sensor limit for this AOI, if the camera reports it
+            for name in ("ResultingFrameRate", "BslResultingAcquisitionFrameRate"):
+                node = cam.GetNodeMap().GetNode(name)
+                if node is not None and genicam.IsReadable(node):
+                    rate = min(rate, node.GetValue())
+                    break
+            if self._tracking["max_fps"]:
+                rate = min(rate, self._tracking["max_fps"])
+            cam.AcquisitionFrameRate.SetValue(rate)
+            cam.AcquisitionFrameRateEnable.SetValue(True)
+        self._frame_rate_metric.set(rate)
+        self._update_pre_trigger_fps(rate)
+        logger.info(f"Frame rate raised to {rate:.1f} fps for the tracking AOI")
+
+    def _restore_full_frame(self):
+        tracking = self._tracking
+        self._apply_aoi(*tracking["full_aoi"])
+        enabled, rate = tracking["full_frame_rate"]
+        with self._camera_lock:
+            self.current_cam.AcquisitionFrameRate.SetValue(rate)
+            self.current_cam.AcquisitionFrameRateEnable.SetValue(enabled)
+        self._frame_rate_metric.set(rate)
+        self._update_pre_trigger_fps(rate)
+        tracking["active"] = False
+
+    def _update_pre_trigger_fps(self, fps):
+        # the ring counts its window in frames, so it follows every tracking frame rate change
+        ring = self.pre_trigger_ring
+        if ring is not None:
+            ring.set_fps(fps)
+
     # ---- camera settings ----
 
+    def set_pixel_format(self, pixel_format: str):
+        '''
+        Select the pixel format used by the next start_capture
+        (BayerRG8, BayerRG12 or BayerRG12p); the workers adapt per frame.
+        An enabled pre-trigger ring is reallocated for the new frame size.
+        '''
+        self._check_pixel_format(pixel_format)
+        if self.is_capturing():
+            raise RuntimeError("Cannot change the pixel format while capturing")
+        previous, self._pixel_format = self._pixel_format, pixel_format
+        if self.pre_trigger_ring is not None and pixel_format != previous:
+            try:
+                self.enable_pre_trigger(**self._pre_trigger_args)
+            except Exception:
+                self._pixel_format = previous
+                raise
+        logger.info(f"Pixel format set to {pixel_format}")
+
+    def _check_pixel_format(self, pixel_format):
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Invalid pixel format: {pixel_format}")
+        if self.is_connected() and pixel_format not in self.current_cam.PixelFormat.Symbolics:
+            raise ValueError(f"Camera does not support pixel format {pixel_format}")
+
+    def get_pixel_format(self):
+        return self._pixel_format
+
     def set_exposure_time(self, exposure_time: int):
         '''
         Set the exposure time of the camera
         '''
         self.current_cam.ExposureTime.SetValue(exposure_time)
+        self._exposure_time = exposure_time
         logger.info(f"Exposure time set to {exposure_time}")
         
     def get_exposure_time(self):
@@ -159,6 +624,7 @@ class CamManager:
         Set the gain of the camera
         '''
         self.current_cam.Gain.SetValue(gain)
+        self._gain = gain
         logger.info(f"Gain set to {gain}")
         
     def get_gain(self):
@@ -178,7 +644,7 @@ class CamManager:
         '''
         Check if the camera is capturing
         '''
-        return self._capture_thread is not None and self._capture_thread.is_alive()
+        return self._watchdog_thread is not None and self._watchdog_thread.is_alive()
     
     def get_resolution(self):
         '''
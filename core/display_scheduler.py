@@ -0,0 +1,117 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.logger import Logger, set_global_log_level_by_name
+
+import time
+import numpy as np
+import dearpygui.dearpygui as dpg
+
+logger = Logger(__name__)
+set_global_log_level_by_name("INFO")
+
+
+''' DisplayScheduler class
+    Shows only the newest processed frame, uploaded at most once per rendered frame.
+    update() must be called from the render loop (right before render_dearpygui_frame),
+    so dpg is only touched from the thread that renders.
+    Two raw textures are used alternately: the new frame is copied into the one
+    that is not shown, then the image series is switched over to it.
+    Textures always have the full-frame size; smaller AOI frames are placed at
+    their sensor offset, so geometry changes never reallocate textures.
+'''
+class DisplayScheduler:
+    def __init__(self, frame_buffer, width, height, consumer="display", max_fps=None, binning=1, max_drain_ms=8.0):
+        self.frame_buffer = frame_buffer
+        self.consumer = consumer
+        self.max_fps = max_fps
+        self.max_drain_ms = max_drain_ms  # time per update() spent receiving frames, a backlog is spread over several
+        self.binning = binning  # sensor pixels per texture pixel, 2 for superpixel modes
+        self.image_series = None
+
+        self._width = width
+        self._height = height
+        self._front = 0
+        self._pending = None
+        self._last_upload = 0.0
+
+        self._buffers = [np.zeros((height, width, 3), dtype=np.float32) for _ in range(2)]
+        self._buffer_rects = [None, None]  # (x, y, w, h) last written into each buffer
+        with dpg.texture_registry():
+            # raw textures read straight from our buffers, no copies inside dpg
+            self._textures = [
+                dpg.add_raw_texture(width=width, height=height, default_value=buffer, format=dpg.mvFormat_Float_rgb)
+                for buffer in self._buffers
+            ]
+
+        metrics = frame_buffer.metrics
+        self._frames_metric = metrics.counter("collimate_display_frames_total", "Frames uploaded to the display texture")
+        self._stale_metric = metrics.counter("collimate_display_frames_stale_total", "Processed frames never shown because a newer one was available")
+        self._upload_metric = metrics.histogram("collimate_display_upload_seconds", "Time to upload a frame to the display texture")
+
+    @property
+    def texture(self):
+        '''
+        Texture currently shown, use it when creating the image series
+        '''
+        return self._textures[self._front]
+
+    def set_image_series(self, image_series):
+        self.image_series = image_series
+
+    def set_max_fps(self, max_fps):
+        '''
+        Cap the display rate (None or 0 for one upload per rendered frame)
+        '''
+        self.max_fps = max_fps
+
+    def update(self):
+        '''
+        Take the newest finished frame and show it; returns True if a frame was uploaded.
+        Always drains the processed queue, so the GUI never backs up the pipeline.
+        '''
+        outputs, discarded = self.frame_buffer.pop_latest_processed_frame(self.max_drain_ms)
+        if outputs is not None:
+            # frames skipped in the frame buffer plus a pending one that was never shown
+            stale = discarded + (self._pending is not None)
+            if stale:
+                self._stale_metric.inc(stale)
+            self._pending = outputs
+
+        if self._pending is None:
+            return False
+        now = time.perf_counter()
+        if self.max_fps and now - self._last_upload < 1.0 / self.max_fps:
+            return False
+
+        upload_start = now
+        back = 1 - self._front
+        frame = self._pending[self.consumer]
+        offset_x, offset_y = self._pending.get("offset", (0, 0))
+        x, y = offset_x // self.binning, offset_y // self.binning
+        h, w = frame.shape[:2]
+        if x + w > self._width or y + h > self._height:
+            logger.warning(f"Display frame {(h, w)} at {(x, y)} does not fit texture {(self._height, self._width)}, skipping")
+            self._pending = None
+            return False
+
+        buffer = self._buffers[back]
+        if self._buffer_rects[back] != (x, y, w, h):
+            # geometry changed, clear what the previous AOI left behind
+            buffer.fill(0.0)
+            self._buffer_rects[back] = (x, y, w, h)
+        target = buffer[y:y + h, x:x + w]
+        if frame.ndim == 2:
+            # mono consumer, show it as gray
+            np.copyto(target, frame[..., None])
+        else:
+            np.copyto(target, frame)
+        if self.image_series is not None:
+            dpg.configure_item(self.image_series, texture_tag=self._textures[back])
+        self._front = back
+        self._pending = None
+        self._last_upload = now
+
+        self._upload_metric.observe(time.perf_counter() - upload_start)
+        self._frames_metric.inc()
+        return True
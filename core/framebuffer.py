@@ -3,67 +3,342 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.logger import Logger, set_global_log_level_by_name
+from core.metrics import MetricsRegistry
+from core.processing_workers import PIXEL_FORMAT_BAYER_RG12
 
 import multiprocessing
+import threading
 import heapq
+import itertools
+import time
 
 logger = Logger(__name__)
 set_global_log_level_by_name("INFO")
 
+DROPPED_SEQ_SLOTS = 4096
+
+
+class BatchChannel:
+    '''
+    Sends items through a multiprocessing.Queue in batches (lists) to amortize
+    pickling, pipe writes and wake-ups. A batch is sent once batch_size items are
+    pending or batch_timeout_ms has passed since the first pending item,
+    whichever comes first. batch_size=1 sends every item on its own.
+    Items are (seq, ...) tuples; with dropped_seqs (a shared array) the seq of
+    every item dropped on a full queue is recorded, so the consumer can skip it.
+    Batches travel as (created, items), created being the time.monotonic() of the
+    first item, so the consumer's wait for more is counted from there, not from arrival.
+    '''
+    def __init__(self, name, maxsize=10, batch_size=1, batch_timeout_ms=0.0, dropped_seqs=None, on_drop=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.queue = multiprocessing.Queue(maxsize=maxsize)
+        self.batch_size = max(1, int(batch_size))
+        self.batch_timeout = batch_timeout_ms / 1000.0
+        self.dropped_seqs = dropped_seqs
+
+        # producer side only, never shared between processes
+        self._pending = []
+        self._pending_since = 0.0
+        self._on_drop = on_drop  # called with the number of items the flusher thread dropped
+        self._cond = threading.Condition()
+        self._flusher = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pending"] = []
+        state["_on_drop"] = None
+        state["_cond"] = None
+        state["_flusher"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        '''
+        Queue an item for the next batch; returns the number of items dropped
+        because the queue was full (0 if nothing was sent or sending succeeded).
+        A partial batch is sent by a flusher thread once batch_timeout_ms has passed,
+        even if no further item arrives.
+        '''
+        with self._cond:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(item)
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._pending_since >= self.batch_timeout:
+                return self._flush_locked()
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name=f"{self.name}-flusher", daemon=True)
+                self._flusher.start()
+            elif len(self._pending) == 1:
+                self._cond.notify()
+        return 0
+
+    def _flush_loop(self):
+        # sends partial batches whose deadline passed; sleeps while nothing is pending
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        self._cond.wait()
+                        continue
+                    remaining = self._pending_since + self.batch_timeout - time.monotonic()
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+                        continue
+                    dropped = self._flush_locked()
+                    break
+            # outside the lock, reporting may log and must not hold up put()
+            if dropped and self._on_drop is not None:
+                self._on_drop(dropped)
+
+    def put_batch(self, items, created=None):
+        '''
+        Send a list of items as one batch right away; returns the number dropped
+        '''
+        if not items:
+            return 0
+        try:
+            self.queue.put_nowait((time.monotonic() if created is None else created, items))
+        except Full:
+            if self.dropped_seqs is not None:
+                slots = len(self.dropped_seqs)
+                for item in items:
+                    self.dropped_seqs[item[0] % slots] = item[0]
+            return len(items)
+        return 0
+
+    def flush(self):
+        '''
+        Send whatever is pending; returns the number of items dropped
+        '''
+        with self._cond:
+            return self._flush_locked()
+
+    def _flush_locked(self):
+        items, self._pending = self._pending, []
+        return self.put_batch(items, self._pending_since)
+
+    def get_batch(self, max_items=None, timeout_ms=None, block=True, wait_ms=None):
+        '''
+        Take up to max_items items (default batch_size), waiting for more until
+        timeout_ms (default batch_timeout_ms) after the first batch was started, so
+        a batch the producer sent on its deadline is not held back a second time.
+        Blocks for the first batch unless block is False, for at most wait_ms
+        if given; returns [] if nothing arrived.
+        '''
+        max_items = self.batch_size if max_items is None else max_items
+        timeout = self.batch_timeout if timeout_ms is None else timeout_ms / 1000.0
+        try:
+            created, items = self.queue.get(block=block, timeout=None if wait_ms is None else wait_ms / 1000.0)
+        except Empty:
+            return []
+
+        items = list(items)
+        deadline = created + timeout
+        while len(items) < max_items:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    items.extend(self.queue.get(timeout=remaining)[1])
+                else:
+                    items.extend(self.queue.get_nowait()[1])
+            except Empty:
+                break
+        return items
+
+    def empty(self):
+        return self.queue.empty()
+
+
+    def depth(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:  # macOS
+            return 0
+
+
 class FrameBuffer:
-    def __init__(self):
-        self.raw_queue = multiprocessing.Queue(maxsize=10)
-        self.processed_queue = multiprocessing.Queue(maxsize=10)
+    def __init__(self, batch_size=1, batch_timeout_ms=0.0, metrics=None, max_reorder_depth=None):
+        # seqs of frames dropped on a full queue (slot seq % DROPPED_SEQ_SLOTS), so
+        # get_processed_frame() skips them instead of waiting for them forever
+        self.dropped_seqs = multiprocessing.RawArray('q', [-1] * DROPPED_SEQ_SLOTS)
+        self.raw_channel = BatchChannel("raw", maxsize=10, batch_size=batch_size, batch_timeout_ms=batch_timeout_ms,
+                                        dropped_seqs=self.dropped_seqs, on_drop=self._count_flusher_drops)
+        self.processed_channel = BatchChannel("processed", maxsize=10, batch_size=batch_size, batch_timeout_ms=batch_timeout_ms,
+                                              dropped_seqs=self.dropped_seqs)
+        self.raw_queue = self.raw_channel.queue
+        self.processed_queue = self.processed_channel.queue
 
         self.reordered_queue = []
+        self.next_expected_seq = multiprocessing.Value('i', 0)
+        # give up on a missing frame once this many later frames are waiting
+        self.max_reorder_depth = max_reorder_depth if max_reorder_depth is not None else max(8, 4 * batch_size)
+
+        # set from any process to trigger a pre-trigger dump (see PreTriggerRing); created here,
+        # before the workers start, so they inherit it
+        self.trigger_event = multiprocessing.Event()
 
         self.raw_frame_ctr = multiprocessing.Value('i', 0)
         self.processed_frame_ctr = multiprocessing.Value('i', 0)
 
-  
+        # shared by CamManager, ImageProcessor workers and the GUI
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        # the raw flusher thread counts drops next to the grab thread, give it its own shard
+        self._flusher_shard = self.metrics.allocate_shard()
+        self._raw_frames = self.metrics.counter("collimate_raw_frames_total", "Raw frames handed to the frame buffer")
+        self._raw_dropped = self.metrics.counter("collimate_raw_frames_dropped_total", "Raw frames dropped because the raw queue was full")
+        self._processed_dropped = self.metrics.counter("collimate_processed_frames_dropped_total", "Processed frames dropped because the processed queue was full")
+        self._reorder_skipped = self.metrics.counter("collimate_reorder_frames_skipped_total", "Missing processed frames skipped by the in-order reader")
+        self._raw_depth = self.metrics.gauge("collimate_raw_queue_depth", "Batches waiting in the raw queue")
+        self._processed_depth = self.metrics.gauge("collimate_processed_queue_depth", "Batches waiting in the processed queue")
+        self._reorder_depth = self.metrics.gauge("collimate_reorder_heap_depth", "Processed frames waiting for reordering")
 
     
     def put_processed_frame(self, processed_frame):
-        try:
-            self.processed_queue.put_nowait((self.processed_frame_ctr.value, processed_frame))
-        except Full:
-            logger.warning(f"Processed queue is full")
-        else:
-            self.processed_frame_ctr.value += 1
+        dropped = self.processed_channel.put((self.processed_frame_ctr.value, processed_frame))
+        self.processed_frame_ctr.value += 1
+        if dropped:
+            self._processed_dropped.inc(dropped)
+            logger.warning(f"Processed queue is full, dropped {dropped} frame(s)")
 
-    def put_raw_frame(self, raw_frame):
-        try:
-            self.raw_queue.put_nowait((self.raw_frame_ctr.value, raw_frame))
-        except Full:
-            logger.warning(f"Raw queue is full")
-        else:
-            self.raw_frame_ctr.value += 1
+    def put_raw_frame(self, raw_frame, offset=(0, 0), pixel_format=PIXEL_FORMAT_BAYER_RG12):
+        '''
+        offset: (x, y) of the frame on the sensor, frames may come from a smaller AOI
+        pixel_format: how raw_frame is laid out, packed formats arrive as uint8 rows
+        '''
+        dropped = self.raw_channel.put((self.raw_frame_ctr.value, raw_frame, offset, pixel_format))
+        self.raw_frame_ctr.value += 1
+        self._raw_frames.inc()
+        self._raw_depth.set(self.raw_channel.depth())
+        self._count_raw_drops(dropped)
+
+    def flush_raw(self):
+        '''
+        Send a partially filled raw batch, e.g. when capture stops
+        '''
+        self._count_raw_drops(self.raw_channel.flush())
 
-    def get_raw_frame(self):
-        return self.raw_queue.get()
+    def _count_flusher_drops(self, dropped):
+        # called on the raw channel's flusher thread
+        self.metrics.bind_thread_shard(self._flusher_shard)
+        self._count_raw_drops(dropped)
 
-    def get_processed_frame(self):
-        self._drain_to_heap()
+    def _count_raw_drops(self, dropped):
+        if dropped:
+            self._raw_dropped.inc(dropped)
+            logger.warning(f"Raw queue is full, dropped {dropped} frame(s)")
+
+    def get_raw_batch(self, max_items=None, timeout_ms=None):
+        return self.raw_channel.get_batch(max_items, timeout_ms)
+
+    def get_processed_frame(self, consumer=None):
+        '''
+        Returns the next processed frame in order, or None.
+        Processed frames hold one output per consumer; pass consumer to get only that one.
+        Frames that were dropped on the way are skipped; a frame that is still missing
+        once max_reorder_depth later frames are waiting is given up on.
+        '''
+        # only pull from the queue when the next frame is not already waiting
+        if not self.reordered_queue or self.reordered_queue[0][0] != self.next_expected_seq.value:
+            self._drain_to_heap()
+        self._skip_missing()
         if self.reordered_queue and self.reordered_queue[0][0] == self.next_expected_seq.value:
-            idx, frame = heapq.heappop(self.reordered_queue)
+            idx, outputs = heapq.heappop(self.reordered_queue)
             self.next_expected_seq.value += 1
-            return frame
+            self._reorder_depth.set(len(self.reordered_queue))
+            if consumer is not None:
+                return outputs[consumer]
+            return outputs
         else:
             return None
 
-    def _drain_to_heap(self):
-        while True:
+    def _skip_missing(self):
+        heap = self.reordered_queue
+        expected = self.next_expected_seq.value
+        # frames older than the expected one arrived too late to ever be returned
+        while heap and heap[0][0] < expected:
+            heapq.heappop(heap)
+        if not heap or heap[0][0] == expected:
+            return
+        first = expected
+        while expected < heap[0][0] and self.dropped_seqs[expected % DROPPED_SEQ_SLOTS] == expected:
+            expected += 1
+        if expected < heap[0][0] and len(heap) > self.max_reorder_depth:
+            logger.warning(f"Processed frames {expected}..{heap[0][0] - 1} never arrived, skipping them")
+            expected = heap[0][0]
+        if expected != first:
+            self._reorder_skipped.inc(expected - first)
+            self.next_expected_seq.value = expected
+
+    def get_latest_processed_frame(self, consumer=None):
+        '''
+        Returns the newest processed frame, or None if nothing new arrived.
+        Older frames are discarded; the in-order sequence continues after the returned frame.
+        '''
+        outputs, _ = self.pop_latest_processed_frame()
+        if outputs is not None and consumer is not None:
+            return outputs[consumer]
+        return outputs
+
+    def pop_latest_processed_frame(self, max_drain_ms=None):
+        '''
+        Like get_latest_processed_frame, returns (outputs or None, number of older frames discarded).
+        Never goes back in time: frames older than the last one returned are discarded, and
+        only the newest frame is kept while draining. With max_drain_ms, draining stops once
+        that much time has passed (after at least one batch); the rest is left for the next call.
+        '''
+        expected = self.next_expected_seq.value
+        discarded = 0
+        latest = None
+        # frames the in-order reader left behind, then whatever is queued
+        items = itertools.chain(self.reordered_queue, (item for batch in self._drain_batches(max_drain_ms) for item in batch))
+        for item in items:
+            if item[0] >= expected and (latest is None or item[0] > latest[0]):
+                if latest is not None:
+                    discarded += 1
+                latest = item
+            else:
+                discarded += 1
+        self.reordered_queue.clear()
+        self._reorder_depth.set(0)
+        if latest is None:
+            return None, discarded
+        self.next_expected_seq.value = latest[0] + 1
+        return latest[1], discarded
+
+    def _drain_batches(self, max_drain_ms=None):
+        '''
+        Yields the batches that were queued when the drain started, so the caller is not
+        kept busy for as long as the workers keep producing
+        '''
+        try:
+            pending = self.processed_queue.qsize()
+        except NotImplementedError:  # macOS
+            pending = self.processed_channel.maxsize
+        deadline = None if max_drain_ms is None else time.perf_counter() + max_drain_ms / 1000.0
+        for _ in range(pending):
             try:
-                item = self.processed_queue.get_nowait()
+                yield self.processed_queue.get_nowait()[1]
             except Empty:
                 break
-            heapq.heappush(self.reordered_queue, item)
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        self._processed_depth.set(self.processed_channel.depth())
+
+    def _drain_to_heap(self):
+        for batch in self._drain_batches():
+            for item in batch:
+                heapq.heappush(self.reordered_queue, item)
+        self._reorder_depth.set(len(self.reordered_queue))
 
     def get_raw_drop_ctr(self):
-        return self.raw_drop_ctr
+        return int(self._raw_dropped.get())
 
     def get_processed_drop_ctr(self):
-        return self.processed_drop_ctr
+        return int(self._processed_dropped.get())
 
     def is_data_available(self):
         return not self.processed_queue.empty()
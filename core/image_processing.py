@@ -1,8 +1,8 @@
 import numpy as np
 import dearpygui.dearpygui as dpg
 from skimage.draw import line
-from utils.logger import Logger, set_global_log_level_by_name
-from core.processing_workers import process_frame
+from utils.logger import Logger, set_global_log_level_by_name, get_log_queue
+from core.processing_workers import process_frame, DEMOSAIC_MODES, DEFAULT_DEMOSAIC_MODES
 import threading
 import time
 import cv2
@@ -46,25 +46,62 @@ class ROILine:
 
 
 class ImageProcessor:
-    def __init__(self, frame_buffer, num_workers=4):
+    def __init__(self, frame_buffer, num_workers=4, demosaic_modes=None, worker_scheduling=None, profile_lines=None, profile_consumer=None, profile_trigger=None):
         self.num_workers = num_workers
 
         self.frame_buffer = frame_buffer
 
-        self.processed_frame_buffer = frame_buffer.raw_queue
-        self.raw_frame_buffer = frame_buffer.processed_queue
+        self.processed_frame_buffer = frame_buffer.processed_channel
+        self.raw_frame_buffer = frame_buffer.raw_channel
+
+        # consumer name -> demosaic mode, e.g. {"measurement": "mono", "display": "bilinear_rgb"}
+        self.demosaic_modes = dict(demosaic_modes or DEFAULT_DEMOSAIC_MODES)
+        for consumer, mode in self.demosaic_modes.items():
+            if mode not in DEMOSAIC_MODES:
+                raise ValueError(f"Invalid demosaic mode for consumer '{consumer}': {mode}")
+
+        # ROI lines ((x0, y0), (x1, y1)) analyzed per frame (core.profile_analysis) on the
+        # output of profile_consumer (default: first consumer); results in outputs["profiles"]
+        self.profile_lines = [tuple(map(tuple, line)) for line in profile_lines] if profile_lines else None
+        self.profile_consumer = profile_consumer
+        if profile_consumer is not None and profile_consumer not in self.demosaic_modes:
+            raise ValueError(f"Unknown profile consumer: {profile_consumer}")
+        # (result key, low, high): a worker sets frame_buffer.trigger_event when a profile
+        # result (e.g. "peak_position") leaves [low, high], see CamManager.enable_pre_trigger
+        self.profile_trigger = tuple(profile_trigger) if profile_trigger else None
+        if self.profile_trigger and not self.profile_lines:
+            raise ValueError("profile_trigger needs profile_lines")
+        self.trigger_event = frame_buffer.trigger_event
+
+        # one SchedulingConfig for all workers or a list with one per worker
+        if isinstance(worker_scheduling, (list, tuple)):
+            if len(worker_scheduling) != num_workers:
+                raise ValueError(f"Expected {num_workers} worker scheduling configs, got {len(worker_scheduling)}")
+            self.worker_scheduling = list(worker_scheduling)
+        else:
+            self.worker_scheduling = [worker_scheduling] * num_workers
        
         self.raw_frame_ctr = frame_buffer.raw_frame_ctr
         self.processed_frame_ctr = frame_buffer.processed_frame_ctr
 
 
+        # register per-worker metrics here, before the workers start, so all processes share the slots
+        self.metrics = frame_buffer.metrics
+        # one shard per worker process, fails here (not silently in the worker) if the registry is too small
+        self.metrics_shards = self.metrics.allocate_shards(num_workers)
+        for i in range(num_workers):
+            labels = {"worker": str(i)}
+            self.metrics.counter("collimate_worker_frames_total", "Frames processed by a worker", labels)
+            self.metrics.gauge("collimate_worker_busy_ratio", "Fraction of time a worker spent processing", labels)
+            self.metrics.histogram("collimate_worker_batch_seconds", "Processing time per batch", labels)
+
         self.worker_processes = []
         self.stop_event = multiprocessing.Event()
 
 
     def start(self):
         for i in range(self.num_workers):
-            worker = multiprocessing.Process(target=process_frame, args=(self.processed_frame_buffer, self.raw_frame_buffer, self.processed_frame_ctr, self.stop_event))
+            worker = multiprocessing.Process(target=process_frame, name=f"Worker-{i}", args=(self.processed_frame_buffer, self.raw_frame_buffer, self.processed_frame_ctr, self.stop_event, self.demosaic_modes, self.worker_scheduling[i], self.metrics, i, get_log_queue(), self.profile_lines, self.profile_consumer, self.metrics_shards[i], self.trigger_event, self.profile_trigger))
             worker.start()
             self.worker_processes.append(worker)
             logger.info(f"Started worker process {i}")
@@ -0,0 +1,259 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.logger import Logger, set_global_log_level_by_name
+
+import multiprocessing
+import threading
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = Logger(__name__)
+set_global_log_level_by_name("INFO")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+''' Metric classes
+    A metric owns a fixed range of slots in the registry's shared array.
+    Every process (and every thread that writes the same metrics as another
+    thread of its process) writes only to its own shard, so updates need no
+    locks or messages; the scraper sums the shards when rendering.
+'''
+class _Metric:
+    TYPE = None
+
+    def __init__(self, registry, name, help_text, labels, offset, size):
+        self._registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._offset = offset
+        self._size = size
+
+    def _index(self, i=0):
+        return self._registry.current_shard() * self._registry.capacity + self._offset + i
+
+    def _total(self, i=0):
+        values = self._registry._values
+        capacity = self._registry.capacity
+        return sum(values[shard * capacity + self._offset + i] for shard in range(self._registry.num_shards))
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1):
+        self._registry._values[self._index()] += amount
+
+    def get(self):
+        return self._total()
+
+
+class Gauge(_Metric):
+    TYPE = "gauge"
+
+    def set(self, value):
+        self._registry._values[self._index()] = value
+
+    def inc(self, amount=1):
+        self._registry._values[self._index()] += amount
+
+    def dec(self, amount=1):
+        self._registry._values[self._index()] -= amount
+
+    def get(self):
+        # a gauge is expected to be written by one thread only, the other shards stay 0
+        return self._total()
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, registry, name, help_text, labels, offset, size, buckets):
+        super().__init__(registry, name, help_text, labels, offset, size)
+        self.buckets = tuple(buckets)
+
+    # slot layout: one per bucket, +Inf, sum, count
+    def observe(self, value):
+        values = self._registry._values
+        base = self._index()
+        values[base + bisect.bisect_left(self.buckets, value)] += 1
+        values[base + len(self.buckets) + 1] += value
+        values[base + len(self.buckets) + 2] += 1
+
+    def get(self):
+        '''
+        Returns (cumulative bucket counts incl. +Inf, sum, count)
+        '''
+        counts = [self._total(i) for i in range(len(self.buckets) + 1)]
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, self._total(len(self.buckets) + 1), self._total(len(self.buckets) + 2)
+
+
+''' MetricsRegistry class
+    Counters, gauges and histograms backed by one shared-memory array.
+    Register all metrics in the main process before starting worker processes,
+    then call bind_shard() once in each worker process. Shards are handed out by
+    allocate_shard() in the main process; shard 0 is the main process itself.
+'''
+class MetricsRegistry:
+    def __init__(self, num_shards=16, capacity=1024):
+        self.num_shards = num_shards
+        self.capacity = capacity
+        self._values = multiprocessing.RawArray('d', num_shards * capacity)
+        self._metrics = {}
+        self._next_offset = 0
+        self._shard = 0
+        self._next_shard = 1
+        self._local = threading.local()
+
+    def bind_shard(self, shard):
+        '''
+        Select the shard this process writes to (0 is the main process)
+        '''
+        if shard < 0 or shard >= self.num_shards:
+            raise ValueError(f"Invalid metrics shard: {shard} (registry has {self.num_shards})")
+        self._shard = shard
+
+    def allocate_shard(self):
+        '''
+        Reserve a shard for a worker process or a thread (main process only)
+        '''
+        return self.allocate_shards(1)[0]
+
+    def allocate_shards(self, count):
+        '''
+        Reserve count shards at once, or none if there are not enough left
+        '''
+        if self._next_shard + count > self.num_shards:
+            raise RuntimeError(f"Metrics registry has {self.num_shards - self._next_shard} free shard(s), {count} needed; "
+                               f"create it with a larger num_shards")
+        shards = list(range(self._next_shard, self._next_shard + count))
+        self._next_shard += count
+        return shards
+
+    def bind_thread_shard(self, shard):
+        '''
+        Select the shard the calling thread writes to, overriding the process' shard
+        '''
+        if shard < 0 or shard >= self.num_shards:
+            raise ValueError(f"Invalid metrics shard: {shard} (registry has {self.num_shards})")
+        self._local.shard = shard
+
+    def current_shard(self):
+        return getattr(self._local, "shard", self._shard)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_local"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _register(self, cls, name, help_text, labels, size, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        if key in self._metrics:
+            metric = self._metrics[key]
+            if not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.TYPE}")
+            return metric
+        if self._next_offset + size > self.capacity:
+            raise RuntimeError(f"Metrics registry is full (capacity {self.capacity})")
+        metric = cls(self, name, help_text, dict(labels or {}), self._next_offset, size, **kwargs)
+        self._next_offset += size
+        self._metrics[key] = metric
+        return metric
+
+    def counter(self, name, help_text="", labels=None):
+        return self._register(Counter, name, help_text, labels, 1)
+
+    def gauge(self, name, help_text="", labels=None):
+        return self._register(Gauge, name, help_text, labels, 1)
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, len(buckets) + 3, buckets=buckets)
+
+    def get(self, name, labels=None):
+        return self._metrics[(name, tuple(sorted((labels or {}).items())))]
+
+    def render(self):
+        '''
+        Render all metrics in the Prometheus text exposition format
+        '''
+        lines = []
+        seen = set()
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            if metric.name not in seen:
+                seen.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help_text}")
+                lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            if isinstance(metric, Histogram):
+                cumulative, total, count = metric.get()
+                for bound, value in zip(list(metric.buckets) + ["+Inf"], cumulative):
+                    lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, le=bound)} {_format_value(value)}")
+                lines.append(f"{metric.name}_sum{_format_labels(metric.labels)} {_format_value(total)}")
+                lines.append(f"{metric.name}_count{_format_labels(metric.labels)} {_format_value(count)}")
+            else:
+                lines.append(f"{metric.name}{_format_labels(metric.labels)} {_format_value(metric.get())}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+''' MetricsServer class
+    Serves the registry as Prometheus text on http://<host>:<port>/metrics.
+    Rendering only reads the shared array, the hot path is never touched.
+'''
+class MetricsServer:
+    def __init__(self, registry, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            logger.info("Stopped metrics server")
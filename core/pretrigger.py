@@ -0,0 +1,222 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.logger import Logger, set_global_log_level_by_name
+
+import json
+import multiprocessing
+import threading
+import time
+import numpy as np
+
+logger = Logger(__name__)
+set_global_log_level_by_name("INFO")
+
+
+''' PreTriggerRing class
+    Pre-allocated ring of the most recent raw frames. On a trigger it keeps
+    recording the post-trigger frames, then dumps the pre- and post-trigger
+    window to disk on a background thread.
+    push() never allocates: frames are copied into fixed slots. Slots that are
+    still being dumped are skipped, so capture keeps running at full rate and
+    only the ring (not the pipeline) misses frames if the disk falls behind.
+    frame_shape is the largest (full) frame; smaller AOI frames use the start
+    of a slot and their shape and sensor offset are recorded per slot.
+'''
+class PreTriggerRing:
+    def __init__(self, frame_shape, dtype, fps, pre_seconds=1.0, post_seconds=0.5, memory_budget_mb=1024, output_dir="recordings", external_trigger=None):
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.fps = fps
+        self.output_dir = output_dir
+
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self.capacity = int(memory_budget_mb * 1024 * 1024) // frame_bytes
+        # the window is set in seconds and counted in frames, see set_fps()
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.post_frames = int(round(post_seconds * fps))
+        self.pre_frames = int(round(pre_seconds * fps))
+        if self.capacity < self.post_frames + 1:
+            raise ValueError(f"Memory budget of {memory_budget_mb} MB holds {self.capacity} frames, "
+                             f"need at least {self.post_frames + 1} for {post_seconds} s after the trigger")
+        if self.pre_frames + self.post_frames > self.capacity:
+            self.pre_frames = self.capacity - self.post_frames
+            logger.warning(f"Memory budget limits the pre-trigger window to {self.pre_frames / fps:.2f} s")
+
+        # allocate and write every page now, so push() never page-faults and the pages
+        # land on the allocating thread's NUMA node (np.zeros would leave them untouched)
+        self._frames = np.empty((self.capacity,) + self.frame_shape, dtype=self.dtype)
+        self._frames.fill(0)
+        self._seq = np.full(self.capacity, -1, dtype=np.int64)
+        self._timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self._locked = np.zeros(self.capacity, dtype=bool)
+        self._shapes = np.zeros((self.capacity, 2), dtype=np.int64)
+        self._offsets = np.zeros((self.capacity, 2), dtype=np.int64)
+        self._write_index = 0
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._pending_trigger = None   # trigger waiting for its post-trigger frames
+        self._dump_thread = None
+
+        # set from any process (e.g. a measurement worker) to trigger on the next frame;
+        # pass an Event created before those processes started, they can only inherit it
+        self.external_trigger = external_trigger if external_trigger is not None else multiprocessing.Event()
+
+        logger.info(f"Pre-trigger ring: {self.capacity} slots ({self.capacity * frame_bytes / 2**20:.0f} MB), "
+                    f"window {self.pre_frames} + {self.post_frames} frames")
+
+    def set_fps(self, fps):
+        '''
+        Re-derive the window in frames after a frame rate change (e.g. a tracking AOI).
+        The slots are not reallocated, so at a higher rate the memory budget may shorten
+        the window, keeping the pre/post ratio; a trigger already waiting keeps its
+        post-trigger frame count.
+        '''
+        pre_frames = int(round(self.pre_seconds * fps))
+        post_frames = int(round(self.post_seconds * fps))
+        limited = pre_frames + post_frames > self.capacity
+        if limited:
+            post_frames = post_frames * self.capacity // (pre_frames + post_frames)
+            pre_frames = self.capacity - post_frames
+        with self._lock:
+            self.fps = fps
+            self.pre_frames = pre_frames
+            self.post_frames = post_frames
+        if limited:
+            logger.warning(f"At {fps:.1f} fps the memory budget limits the pre-trigger window to "
+                           f"{self.pre_frames / fps:.3f} s + {self.post_frames / fps:.3f} s")
+        else:
+            logger.info(f"Pre-trigger window at {fps:.1f} fps: {self.pre_frames} + {self.post_frames} frames")
+
+    def push(self, frame, seq, timestamp=None, offset=(0, 0)):
+        '''
+        Copy a frame into the ring; returns False if the slot is still held by a dump
+        '''
+        if self.external_trigger.is_set():
+            self.external_trigger.clear()
+            self.trigger("external")
+
+        index = self._write_index
+        if self._locked[index]:
+            self.dropped += 1
+            return False
+        height, width = frame.shape[:2]
+        np.copyto(self._slot_view(index, height, width), frame)
+        self._shapes[index] = (height, width)
+        self._offsets[index] = offset
+        self._seq[index] = seq
+        self._timestamps[index] = time.time() if timestamp is None else timestamp
+        self._write_index = (index + 1) % self.capacity
+
+        pending = self._pending_trigger
+        if pending is not None:
+            pending["remaining"] -= 1
+            if pending["remaining"] <= 0:
+                self._start_dump()
+        return True
+
+    def trigger(self, reason="manual"):
+        '''
+        Request a dump of the frames around now; returns False if a trigger is already being handled
+        '''
+        with self._lock:
+            if self._pending_trigger is not None or self.is_dumping():
+                logger.warning(f"Trigger '{reason}' ignored, previous trigger is still being handled")
+                return False
+            last_index = (self._write_index - 1) % self.capacity
+            self._pending_trigger = {
+                "reason": reason,
+                "time": time.time(),
+                "trigger_seq": int(self._seq[last_index]),
+                "remaining": self.post_frames,
+            }
+        logger.info(f"Pre-trigger ring triggered ({reason})")
+        if self.post_frames == 0:
+            self._start_dump()
+        return True
+
+    def _slot_view(self, index, height, width):
+        # first height * width elements of the slot, without copying
+        return self._frames[index].reshape(-1)[:height * width].reshape(height, width)
+
+    def is_dumping(self):
+        return self._dump_thread is not None and self._dump_thread.is_alive()
+
+    def _start_dump(self):
+        with self._lock:
+            info, self._pending_trigger = self._pending_trigger, None
+            if info is None:
+                return
+            # the window ends with the frame just written, oldest first
+            window = self.pre_frames + self.post_frames
+            slots = [(self._write_index - window + i) % self.capacity for i in range(window)]
+            slots = [slot for slot in slots if self._seq[slot] >= 0]
+            self._locked[slots] = True
+        info.pop("remaining")
+        self._dump_thread = threading.Thread(target=self._dump, args=(slots, info), name="PreTriggerDump", daemon=True)
+        self._dump_thread.start()
+
+    def _dump(self, slots, info):
+        path = os.path.join(self.output_dir, time.strftime("%Y%m%d-%H%M%S", time.localtime(info["time"])) + f"_{info['reason']}_{info['trigger_seq']}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            frames = np.lib.format.open_memmap(os.path.join(path, "frames.npy"), mode="w+",
+                                               dtype=self.dtype, shape=(len(slots),) + self.frame_shape)
+            seqs = []
+            timestamps = []
+            shapes = []
+            offsets = []
+            for i, slot in enumerate(slots):
+                # AOI frames are written to the top-left of their full-size entry
+                height, width = (int(v) for v in self._shapes[slot])
+                frames[i, :height, :width] = self._slot_view(slot, height, width)
+                seqs.append(int(self._seq[slot]))
+                timestamps.append(float(self._timestamps[slot]))
+                shapes.append([height, width])
+                offsets.append([int(v) for v in self._offsets[slot]])
+                # hand the slot back to push() as soon as it is on its way to disk
+                self._locked[slot] = False
+            frames.flush()
+            del frames
+
+            info.update({"fps": self.fps, "seq": seqs, "timestamps": timestamps, "shapes": shapes, "offsets": offsets,
+                         "pre_frames": sum(seq <= info["trigger_seq"] for seq in seqs),
+                         "post_frames": sum(seq > info["trigger_seq"] for seq in seqs)})
+            with open(os.path.join(path, "trigger.json"), "w") as f:
+                json.dump(info, f, indent=2)
+            logger.info(f"Dumped {len(slots)} frames around trigger '{info['reason']}' to {path}")
+        except Exception as e:
+            logger.error(f"Pre-trigger dump failed: {e}")
+        finally:
+            self._locked[slots] = False
+
+
+''' ThresholdTrigger class
+    Triggers a PreTriggerRing (or sets a trigger Event, e.g. FrameBuffer.trigger_event
+    from a worker process) when a measurement leaves [low, high].
+    Values may be arrays (one per ROI line); nan values never trigger.
+    Re-arms once the value is back in tolerance.
+'''
+class ThresholdTrigger:
+    def __init__(self, ring, low=None, high=None, reason="threshold"):
+        self.ring = ring  # PreTriggerRing or multiprocessing.Event
+        self.low = low
+        self.high = high
+        self.reason = reason
+        self._armed = True
+
+    def check(self, value):
+        value = np.asarray(value)
+        out_of_tolerance = bool((self.low is not None and np.any(value < self.low)) or (self.high is not None and np.any(value > self.high)))
+        if out_of_tolerance and self._armed:
+            self._armed = False
+            if isinstance(self.ring, PreTriggerRing):
+                self.ring.trigger(self.reason)
+            else:
+                self.ring.set()
+            return True
+        if not out_of_tolerance:
+            self._armed = True
+        return False
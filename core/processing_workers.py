@@ -1,28 +1,214 @@
 import cv2, time
-from queue import Full
+import multiprocessing
+import numpy as np
 from line_profiler import profile
+from core.scheduling import apply_scheduling, JitterMonitor
+from utils.logger import configure_worker_logging
+from core.profile_analysis import ProfileSampler, analyze_profiles
+from core.pretrigger import ThresholdTrigger
 
+# longest a worker waits for a raw batch before updating its metrics and checking stop_event
+WORKER_IDLE_WAIT_MS = 250
+
+
+# ---- demosaic modes ----
+# Selectable per consumer (e.g. mono for measurement, RGB for the preview).
+DEMOSAIC_BILINEAR_RGB = "bilinear_rgb"       # full resolution, 3 channels (interpolated)
+DEMOSAIC_MONO = "mono"                       # full resolution, luminance only
+DEMOSAIC_SUPERPIXEL_MONO = "superpixel_mono" # half resolution, 2x2 bin, 1 channel
+DEMOSAIC_SUPERPIXEL_RGB = "superpixel_rgb"   # half resolution, 2x2 bin, 3 channels
+
+DEMOSAIC_MODES = (
+    DEMOSAIC_BILINEAR_RGB,
+    DEMOSAIC_MONO,
+    DEMOSAIC_SUPERPIXEL_MONO,
+    DEMOSAIC_SUPERPIXEL_RGB,
+)
+
+DEFAULT_DEMOSAIC_MODES = {"display": DEMOSAIC_BILINEAR_RGB}
+
+
+def demosaic_binning(mode):
+    '''
+    Sensor pixels per output pixel along each axis for a demosaic mode
+    '''
+    return 2 if mode in (DEMOSAIC_SUPERPIXEL_MONO, DEMOSAIC_SUPERPIXEL_RGB) else 1
+
+
+# ---- pixel formats ----
+PIXEL_FORMAT_BAYER_RG8 = "BayerRG8"
+PIXEL_FORMAT_BAYER_RG12 = "BayerRG12"     # 12 bit in 16 bit containers
+PIXEL_FORMAT_BAYER_RG12P = "BayerRG12p"   # 12 bit packed, 2 pixels in 3 bytes
+
+PIXEL_FORMATS = (PIXEL_FORMAT_BAYER_RG8, PIXEL_FORMAT_BAYER_RG12, PIXEL_FORMAT_BAYER_RG12P)
+
+
+def _packed_pixels(packed_rows):
+    '''
+    Split packed 12 bit rows (height, width * 3/2 bytes) into the even and odd column pixels.
+    GenICam "p" layout: byte0 = p0[7:0], byte1 = p1[3:0] << 4 | p0[11:8], byte2 = p1[11:4]
+    '''
+    triplets = packed_rows.reshape(packed_rows.shape[0], -1, 3)
+    b0 = triplets[..., 0]
+    b1 = triplets[..., 1]
+    b2 = triplets[..., 2]
+    even = b0 | ((b1 & 0x0F).astype(np.uint16) << 8)
+    odd = (b1 >> 4) | (b2.astype(np.uint16) << 4)
+    return even, odd
+
+
+def unpack_12p(packed_frame):
+    '''
+    Unpack a BayerRG12p frame (height, width * 3/2) uint8 into a (height, width) uint16 frame
+    '''
+    height = packed_frame.shape[0]
+    width = packed_frame.shape[1] * 2 // 3
+    frame = np.empty((height, width), dtype=np.uint16)
+    frame[:, 0::2], frame[:, 1::2] = _packed_pixels(packed_frame)
+    return frame
+
+
+def _superpixel(r, g1, g2, b, mode):
+    # r, g1, g2, b: the four half resolution planes of the RGGB cells
+    r = r.astype(np.float32)
+    if mode == DEMOSAIC_SUPERPIXEL_MONO:
+        r += g1
+        r += g2
+        r += b
+        r *= 0.25
+        return r
+    if mode == DEMOSAIC_SUPERPIXEL_RGB:
+        superpixel = np.empty(r.shape + (3,), dtype=np.float32)
+        superpixel[..., 0] = r
+        np.add(g1, g2, out=superpixel[..., 1], dtype=np.float32)
+        superpixel[..., 1] *= 0.5
+        superpixel[..., 2] = b
+        return superpixel
+    raise ValueError(f"Invalid demosaic mode: {mode}")
+
+
+def demosaic(raw_frame, mode=DEMOSAIC_BILINEAR_RGB, pixel_format=PIXEL_FORMAT_BAYER_RG12):
+    '''
+    Convert a BayerRG frame according to the given demosaic mode.
+    The superpixel modes read each 2x2 RGGB cell directly, no interpolation.
+    BayerRG12p frames are unpacked on the fly; for the superpixel modes the
+    cells are read straight from the packed bytes, no full uint16 frame is made.
+    '''
+    if pixel_format == PIXEL_FORMAT_BAYER_RG12P:
+        if mode in (DEMOSAIC_SUPERPIXEL_MONO, DEMOSAIC_SUPERPIXEL_RGB):
+            # even rows hold R G, odd rows G B
+            r, g1 = _packed_pixels(raw_frame[0::2])
+            g2, b = _packed_pixels(raw_frame[1::2])
+            return _superpixel(r, g1, g2, b, mode)
+        raw_frame = unpack_12p(raw_frame)
+    elif pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"Invalid pixel format: {pixel_format}")
+
+    if mode == DEMOSAIC_BILINEAR_RGB:
+        return cv2.cvtColor(raw_frame, cv2.COLOR_BayerRG2RGB)
+    if mode == DEMOSAIC_MONO:
+        return cv2.cvtColor(raw_frame, cv2.COLOR_BayerRG2GRAY)
+
+    # RGGB cell: R at (0, 0), G at (0, 1) and (1, 0), B at (1, 1)
+    return _superpixel(raw_frame[0::2, 0::2], raw_frame[0::2, 1::2], raw_frame[1::2, 0::2], raw_frame[1::2, 1::2], mode)
+
+
+def _analyze_batch(processed_batch, consumer, lines, samplers, binning=1):
+    '''
+    Sample the ROI lines from the consumer's output of every frame in the batch and
+    analyze all (frames x lines x samples) profiles at once; results go into outputs["profiles"].
+    Lines are in full-frame consumer coordinates and are shifted to each frame's AOI offset;
+    lines that leave the AOI are reported invalid (profiles["valid"] False, results nan).
+    '''
+    # frames of equal geometry are sampled and analyzed together; the sampler reads the
+    # (mono or RGB) frames in place, so no full-frame temporaries are made here
+    groups = {}
+    for i, (_, outputs) in enumerate(processed_batch):
+        offset = (outputs["offset"][0] // binning, outputs["offset"][1] // binning)
+        groups.setdefault((outputs[consumer].shape[:2], offset), []).append(i)
+
+    for (shape, (offset_x, offset_y)), members in groups.items():
+        if (shape, offset_x, offset_y) not in samplers:
+            # keep the cache bounded when a tracking AOI keeps moving
+            if len(samplers) > 16:
+                samplers.clear()
+            shifted = [((x0 - offset_x, y0 - offset_y), (x1 - offset_x, y1 - offset_y)) for (x0, y0), (x1, y1) in lines]
+            samplers[(shape, offset_x, offset_y)] = ProfileSampler(shifted, shape)
+        frames = [processed_batch[i][1][consumer] for i in members]
+        results = analyze_profiles(samplers[(shape, offset_x, offset_y)].sample(frames))
+        for row, i in enumerate(members):
+            processed_batch[i][1]["profiles"] = {key: value[row] for key, value in results.items()}
 
 
 @profile
-def process_frame(processed_frame_buffer, raw_frame_buffer, processed_frame_ctr, stop_event):
+def process_frame(processed_frame_buffer, raw_frame_buffer, processed_frame_ctr, stop_event, demosaic_modes=None, scheduling=None, metrics=None, worker_index=0, log_queue=None, profile_lines=None, profile_consumer=None, metrics_shard=None, trigger_event=None, profile_trigger=None):
+    '''
+    Worker loop: takes a batch of raw frames from raw_frame_buffer (a BatchChannel),
+    demosaics every frame for every consumer and sends the results as one batch.
+    '''
+    # log through the main process' listener instead of writing to the console ourselves
+    configure_worker_logging(log_queue)
+    # pin before allocating anything, so first-touch puts our buffers on the local NUMA node
+    apply_scheduling(scheduling)
+    jitter = JitterMonitor(multiprocessing.current_process().name)
+
+    if metrics is not None:
+        # shard 0 belongs to the main process, ImageProcessor allocates one per worker
+        metrics.bind_shard(metrics_shard if metrics_shard is not None else worker_index + 1)
+        labels = {"worker": str(worker_index)}
+        frames_metric = metrics.get("collimate_worker_frames_total", labels)
+        busy_metric = metrics.get("collimate_worker_busy_ratio", labels)
+        batch_metric = metrics.get("collimate_worker_batch_seconds", labels)
+        dropped_metric = metrics.get("collimate_processed_frames_dropped_total")
+    busy_time = 0.0
+    window_start = time.perf_counter()
+
+    if demosaic_modes is None:
+        demosaic_modes = DEFAULT_DEMOSAIC_MODES
+    if profile_consumer is None:
+        profile_consumer = next(iter(demosaic_modes))
+    profile_samplers = {}  # (frame shape, offset) -> ProfileSampler
+    threshold_trigger = None
+    if profile_trigger and trigger_event is not None:
+        trigger_key, low, high = profile_trigger
+        threshold_trigger = ThresholdTrigger(trigger_event, low, high, reason=trigger_key)
     while not stop_event.is_set():
-        raw_frame = raw_frame_buffer.get()
-        if raw_frame is not None:
+        raw_batch = raw_frame_buffer.get_batch(wait_ms=WORKER_IDLE_WAIT_MS)
+        if raw_batch:
+            jitter.tick()
+            batch_start = time.perf_counter()
             #logger.info("Processing raw frame")
-            
-            rgb_frame = cv2.cvtColor(raw_frame, cv2.COLOR_BayerRG2RGB)
-            rgb_frame = cv2.normalize(rgb_frame, None, 0.0, 1.0, cv2.NORM_MINMAX, dtype=cv2.CV_32F)
+            processed_batch = []
+            for seq_num, raw_frame, offset, pixel_format in raw_batch:
+                # one output per consumer, each in the mode that consumer asked for
+                outputs = {"offset": offset}
+                for consumer, mode in demosaic_modes.items():
+                    frame = demosaic(raw_frame, mode, pixel_format)
+                    outputs[consumer] = cv2.normalize(frame, None, 0.0, 1.0, cv2.NORM_MINMAX, dtype=cv2.CV_32F)
+                processed_batch.append((seq_num, outputs))
+            if profile_lines:
+                _analyze_batch(processed_batch, profile_consumer, profile_lines, profile_samplers,
+                               demosaic_binning(demosaic_modes[profile_consumer]))
+                if threshold_trigger is not None:
+                    for _, outputs in processed_batch:
+                        threshold_trigger.check(outputs["profiles"][trigger_key])
             #rgb_frame = rgb_frame.astype(np.float32) * (1/4096.0) # 28.8ms
-            try: 
-                print("Test")
-                processed_frame_buffer.put_nowait((processed_frame_ctr.value, rgb_frame))
-            except Full:
-                #logger.warning(f"Processed frame buffer is full")
-                pass
-            else:
-                processed_frame_ctr.value += 1
+            dropped = processed_frame_buffer.put_batch(processed_batch)
+            with processed_frame_ctr.get_lock():
+                processed_frame_ctr.value += len(processed_batch) - dropped
             #print(f"Processed frame: {rgb_frame.shape}")
-        else:
-            time.sleep(0.1)
-    
\ No newline at end of file
+
+            batch_end = time.perf_counter()
+            busy_time += batch_end - batch_start
+            if metrics is not None:
+                frames_metric.inc(len(processed_batch))
+                batch_metric.observe(batch_end - batch_start)
+                if dropped:
+                    dropped_metric.inc(dropped)
+
+        # also updated while idle, so the ratio falls to 0 when the pipeline stalls
+        now = time.perf_counter()
+        if metrics is not None and now - window_start >= 1.0:
+            busy_metric.set(busy_time / (now - window_start))
+            busy_time = 0.0
+            window_start = now
@@ -0,0 +1,227 @@
+import numpy as np
+
+
+''' Vectorized analysis of ROI line profiles
+    Everything works on arrays of shape (..., samples), typically
+    (frames x lines x samples), so a whole batch is analyzed in one go.
+    Positions are subpixel sample indices along the profile (nan if not found).
+    Profiles of lines that leave the image are all nan and give nan results.
+'''
+
+
+''' ProfileSampler class
+    Samples straight lines ((x0, y0), (x1, y1)) from images with bilinear
+    interpolation. Coordinates and weights are computed once per geometry,
+    so sample() is a handful of gathers per frame.
+    Lines that are not completely inside the image are marked invalid (valid[i]
+    is False) and sampled as nan instead of being clipped to the border.
+'''
+class ProfileSampler:
+    def __init__(self, lines, image_shape, num_samples=None):
+        self.lines = [((float(x0), float(y0)), (float(x1), float(y1))) for (x0, y0), (x1, y1) in lines]
+        self.image_shape = tuple(image_shape[:2])
+        if num_samples is None:
+            # about one sample per pixel along the longest line
+            num_samples = int(max(np.hypot(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in self.lines)) + 1
+        self.num_samples = num_samples
+
+        height, width = self.image_shape
+        t = np.linspace(0.0, 1.0, num_samples)
+        start = np.array([line[0] for line in self.lines])   # (lines, 2) as x, y
+        end = np.array([line[1] for line in self.lines])
+        x = start[:, 0:1] + (end[:, 0:1] - start[:, 0:1]) * t
+        y = start[:, 1:2] + (end[:, 1:2] - start[:, 1:2]) * t
+        self.valid = ((x >= 0) & (x <= width - 1) & (y >= 0) & (y <= height - 1)).all(axis=-1)
+        x = np.clip(x, 0, width - 1)
+        y = np.clip(y, 0, height - 1)
+
+        x0 = np.minimum(np.floor(x).astype(np.intp), width - 2 if width > 1 else 0)
+        y0 = np.minimum(np.floor(y).astype(np.intp), height - 2 if height > 1 else 0)
+        fx = (x - x0).astype(np.float32)
+        fy = (y - y0).astype(np.float32)
+        x1 = np.minimum(x0 + 1, width - 1)
+        y1 = np.minimum(y0 + 1, height - 1)
+
+        # flat indices of the 4 neighbours and their weights, each (lines, samples)
+        self._indices = [y0 * width + x0, y0 * width + x1, y1 * width + x0, y1 * width + x1]
+        self._weights = [(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy]
+        # channel count -> (indices, weights) for interleaved (height, width, channels) frames
+        self._channel_taps = {1: (self._indices, self._weights)}
+
+    def _taps(self, channels):
+        if channels not in self._channel_taps:
+            offsets = np.arange(channels)
+            indices = [i[..., None] * channels + offsets for i in self._indices]
+            weights = [w[..., None] / channels for w in self._weights]
+            self._channel_taps[channels] = (indices, weights)
+        return self._channel_taps[channels]
+
+    def sample(self, frames):
+        '''
+        frames: one (height, width) frame, a (frames, height, width) stack, or a sequence of
+        (height, width) or (height, width, channels) frames -> (lines, samples) for a single
+        frame, else (frames, lines, samples). Channels are averaged at the sample points only,
+        the frames are read in place without full-frame temporaries.
+        '''
+        single = isinstance(frames, np.ndarray) and frames.ndim == 2
+        if single:
+            frames = [frames]
+        profiles = np.zeros((len(frames), len(self.lines), self.num_samples), dtype=np.float32)
+        for profile, frame in zip(profiles, frames):
+            if frame.shape[:2] != self.image_shape:
+                raise ValueError(f"Frame shape {frame.shape[:2]} does not match sampler shape {self.image_shape}")
+            channels = frame.shape[2] if frame.ndim == 3 else 1
+            # a view for contiguous frames, which is what the workers produce
+            flat = frame.reshape(-1)
+            for indices, weights in zip(*self._taps(channels)):
+                values = flat[indices] * weights
+                profile += values.sum(axis=-1) if channels > 1 else values
+        profiles[:, ~self.valid] = np.nan
+        return profiles[0] if single else profiles
+
+
+def _parabolic_offset(left, center, right):
+    # vertex of the parabola through (-1, left), (0, center), (1, right)
+    denom = left - 2 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(denom != 0, 0.5 * (left - right) / denom, 0.0)
+    return np.clip(offset, -0.5, 0.5)
+
+def _take(values, indices):
+    return np.take_along_axis(values, indices[..., None], axis=-1)[..., 0]
+
+
+def find_edges(profiles, polarity="both", method="parabolic", window=3):
+    '''
+    Subpixel position of the strongest edge per profile.
+    polarity: "rising", "falling" or "both" (strongest of either)
+    method: "parabolic" (3-point fit of the gradient) or "centroid" (of the gradient over +-window samples)
+    Returns (positions, strengths); strength is the signed gradient at the edge.
+    Both are nan where the profile has no edge of the requested polarity.
+    '''
+    profiles = np.asarray(profiles, dtype=np.float32)
+    gradient = np.gradient(profiles, axis=-1)
+    if polarity == "rising":
+        score = gradient
+    elif polarity == "falling":
+        score = -gradient
+    elif polarity == "both":
+        score = np.abs(gradient)
+    else:
+        raise ValueError(f"Invalid edge polarity: {polarity}")
+
+    samples = profiles.shape[-1]
+    index = np.argmax(score, axis=-1)
+    if method == "parabolic":
+        inner = np.clip(index, 1, samples - 2)
+        offset = _parabolic_offset(_take(score, inner - 1), _take(score, inner), _take(score, inner + 1))
+        # no interpolation at the profile ends
+        position = index + np.where(index == inner, offset, 0.0)
+    elif method == "centroid":
+        neighbours = index[..., None] + np.arange(-window, window + 1)
+        inside = (neighbours >= 0) & (neighbours < samples)
+        neighbours = np.clip(neighbours, 0, samples - 1)
+        weights = np.where(inside, np.clip(np.take_along_axis(score, neighbours, axis=-1), 0, None), 0.0)
+        total = weights.sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            position = np.where(total > 0, (weights * neighbours).sum(axis=-1) / total, index)
+    else:
+        raise ValueError(f"Invalid edge method: {method}")
+    # flat profile, or only edges of the other polarity
+    found = _take(score, index) > 0
+    return np.where(found, position, np.nan), np.where(found, _take(gradient, index), np.nan)
+
+
+def find_peaks(profiles, method="parabolic", window=3):
+    '''
+    Subpixel position, height above baseline and FWHM of the highest peak per profile.
+    method: "parabolic" (3-point fit) or "centroid" (over +-window samples)
+    Returns a dict of arrays with shape profiles.shape[:-1].
+    '''
+    profiles = np.asarray(profiles, dtype=np.float32)
+    samples = profiles.shape[-1]
+    baseline = np.median(profiles, axis=-1)
+    index = np.argmax(profiles, axis=-1)
+    peak_value = _take(profiles, index)
+    height = peak_value - baseline
+
+    if method == "parabolic":
+        inner = np.clip(index, 1, samples - 2)
+        offset = _parabolic_offset(_take(profiles, inner - 1), _take(profiles, inner), _take(profiles, inner + 1))
+        position = index + np.where(index == inner, offset, 0.0)
+    elif method == "centroid":
+        offsets = np.arange(-window, window + 1)
+        neighbours = np.clip(index[..., None] + offsets, 0, samples - 1)
+        weights = np.clip(np.take_along_axis(profiles, neighbours, axis=-1) - baseline[..., None], 0, None)
+        total = weights.sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            position = np.where(total > 0, (weights * neighbours).sum(axis=-1) / total, index)
+    else:
+        raise ValueError(f"Invalid peak method: {method}")
+
+    # full width at half maximum from the linearly interpolated half-level crossings
+    half = (baseline + height / 2)[..., None]
+    below = profiles < half
+    samples_idx = np.arange(samples)
+    left = np.where(below & (samples_idx < index[..., None]), samples_idx, -1).max(axis=-1)
+    right = np.where(below & (samples_idx > index[..., None]), samples_idx, samples).min(axis=-1)
+    valid = (left >= 0) & (right < samples) & (height > 0)
+    left_c = np.clip(left, 0, samples - 2)
+    right_c = np.clip(right, 1, samples - 1)
+    half = half[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y0, y1 = _take(profiles, left_c), _take(profiles, left_c + 1)
+        left_cross = left_c + (half - y0) / (y1 - y0)
+        y0, y1 = _take(profiles, right_c - 1), _take(profiles, right_c)
+        right_cross = right_c - 1 + (half - y0) / (y1 - y0)
+    fwhm = np.where(valid, right_cross - left_cross, np.nan)
+
+    return {"position": position, "height": height, "baseline": baseline, "fwhm": fwhm}
+
+
+def profile_quality(profiles):
+    '''
+    Michelson contrast and a peak signal-to-noise ratio per profile.
+    Noise is estimated robustly from the median absolute first difference.
+    '''
+    profiles = np.asarray(profiles, dtype=np.float32)
+    maximum = profiles.max(axis=-1)
+    minimum = profiles.min(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        contrast = np.where(maximum + minimum > 0, (maximum - minimum) / (maximum + minimum), 0.0)
+        # MAD of first differences -> sigma of white noise
+        noise = np.median(np.abs(np.diff(profiles, axis=-1)), axis=-1) / (0.6745 * np.sqrt(2))
+        snr = np.where(noise > 0, (maximum - np.median(profiles, axis=-1)) / noise, np.inf)
+    return {"contrast": contrast, "snr": snr}
+
+
+def analyze_profiles(profiles, peak_method="parabolic", edge_method="parabolic"):
+    '''
+    Edges, peak and quality metrics for every profile in one call.
+    peak_method and edge_method select the subpixel interpolation ("parabolic" or "centroid").
+    "valid" is False for profiles containing nan (lines outside the image); all their results are nan.
+    '''
+    profiles = np.asarray(profiles, dtype=np.float32)
+    valid = ~np.isnan(profiles).any(axis=-1)
+    if not valid.all():
+        profiles = np.where(valid[..., None], profiles, 0.0).astype(np.float32)
+    rising, rising_strength = find_edges(profiles, "rising", edge_method)
+    falling, falling_strength = find_edges(profiles, "falling", edge_method)
+    peaks = find_peaks(profiles, peak_method)
+    quality = profile_quality(profiles)
+    results = {
+        "edge_rising": rising,
+        "edge_rising_strength": rising_strength,
+        "edge_falling": falling,
+        "edge_falling_strength": falling_strength,
+        "peak_position": peaks["position"],
+        "peak_height": peaks["height"],
+        "peak_fwhm": peaks["fwhm"],
+        "baseline": peaks["baseline"],
+        "contrast": quality["contrast"],
+        "snr": quality["snr"],
+    }
+    if not valid.all():
+        results = {key: np.where(valid, value, np.nan) for key, value in results.items()}
+    results["valid"] = valid
+    return results
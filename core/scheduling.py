@@ -0,0 +1,206 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.logger import Logger, set_global_log_level_by_name
+
+import threading
+import multiprocessing
+import time
+import math
+from contextlib import contextmanager
+
+logger = Logger(__name__)
+set_global_log_level_by_name("INFO")
+
+NUMA_SYSFS_PATH = "/sys/devices/system/node"
+
+
+''' SchedulingConfig class
+    Describes where and how a thread (grab thread, worker process, ...) should run.
+    Everything is optional; None leaves the OS default in place.
+'''
+class SchedulingConfig:
+    def __init__(self, cpus=None, nice=None, rt_priority=None, numa_node=None, name=None):
+        '''
+        cpus:        cores to pin to, e.g. [2, 3]
+        nice:        nice value (-20..19), lower is more important
+        rt_priority: SCHED_FIFO priority (1..99), needs CAP_SYS_NICE / rtprio limit
+        numa_node:   pin to all cores of this node if cpus is not given,
+                     so that buffers touched first by this thread are node-local
+        '''
+        self.cpus = sorted(set(cpus)) if cpus is not None else None
+        self.nice = nice
+        self.rt_priority = rt_priority
+        self.numa_node = numa_node
+        self.name = name
+
+        if self.cpus is None and self.numa_node is not None:
+            self.cpus = cpus_of_numa_node(self.numa_node)
+
+    def __repr__(self):
+        return f"SchedulingConfig(name={self.name}, cpus={self.cpus}, nice={self.nice}, rt_priority={self.rt_priority}, numa_node={self.numa_node})"
+
+
+# ---- NUMA topology ----
+
+def _parse_cpu_list(cpu_list):
+    # "0-3,8-11" -> [0, 1, 2, 3, 8, 9, 10, 11]
+    cpus = []
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def numa_nodes():
+    '''
+    Returns {node: [cpus]}; a single node 0 with all cpus if NUMA info is unavailable
+    '''
+    nodes = {}
+    if os.path.isdir(NUMA_SYSFS_PATH):
+        for entry in os.listdir(NUMA_SYSFS_PATH):
+            if entry.startswith("node") and entry[4:].isdigit():
+                with open(os.path.join(NUMA_SYSFS_PATH, entry, "cpulist")) as f:
+                    nodes[int(entry[4:])] = _parse_cpu_list(f.read())
+    if not nodes:
+        nodes[0] = list(range(os.cpu_count() or 1))
+    return nodes
+
+def cpus_of_numa_node(node):
+    nodes = numa_nodes()
+    if node not in nodes:
+        raise ValueError(f"Invalid NUMA node: {node}")
+    return nodes[node]
+
+def numa_node_of_cpu(cpu):
+    for node, cpus in numa_nodes().items():
+        if cpu in cpus:
+            return node
+    raise ValueError(f"Invalid cpu: {cpu}")
+
+
+# ---- applying a config to the calling thread ----
+
+def apply_scheduling(config):
+    '''
+    Apply a SchedulingConfig to the calling thread.
+    Settings that are not permitted or not supported are logged and skipped.
+    '''
+    if config is None:
+        return
+    name = config.name or f"{multiprocessing.current_process().name}/{threading.current_thread().name}"
+
+    if config.cpus is not None:
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                # pid 0 is the calling thread on Linux
+                os.sched_setaffinity(0, config.cpus)
+                logger.info(f"[{name}] pinned to cpus {config.cpus}")
+            except OSError as e:
+                logger.warning(f"[{name}] could not set cpu affinity {config.cpus}: {e}")
+        else:
+            logger.warning(f"[{name}] cpu affinity is not supported on this platform")
+
+    if config.nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), config.nice)
+            logger.info(f"[{name}] nice set to {config.nice}")
+        except (OSError, AttributeError) as e:
+            logger.warning(f"[{name}] could not set nice {config.nice}: {e}")
+
+    if config.rt_priority is not None:
+        if hasattr(os, "sched_setscheduler"):
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(config.rt_priority))
+                logger.info(f"[{name}] SCHED_FIFO priority set to {config.rt_priority}")
+            except OSError as e:
+                logger.warning(f"[{name}] could not set real-time priority {config.rt_priority}: {e}")
+        else:
+            logger.warning(f"[{name}] real-time priority is not supported on this platform")
+
+@contextmanager
+def numa_local(config):
+    '''
+    Temporarily pin the calling thread to the config's cpus, so that memory
+    allocated and first touched inside the block (e.g. pylon grab buffers in
+    StartGrabbing) lands on the same NUMA node as the thread that will use it.
+    '''
+    if config is None or config.cpus is None or not hasattr(os, "sched_setaffinity"):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, config.cpus)
+    except OSError as e:
+        logger.warning(f"could not pin to cpus {config.cpus} for allocation: {e}")
+        yield
+        return
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+''' JitterMonitor class
+    Measures the interval between tick() calls of a loop and periodically
+    logs the mean period, jitter (std dev) and worst case.
+'''
+class JitterMonitor:
+    def __init__(self, name, report_interval=5.0):
+        self.name = name
+        self.report_interval = report_interval
+        self._last_tick = None
+        self._last_report = time.perf_counter()
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._max = 0.0
+        self._min = math.inf
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            interval = now - self._last_tick
+            # Welford's running mean/variance
+            self._count += 1
+            delta = interval - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (interval - self._mean)
+            if interval > self._max:
+                self._max = interval
+            if interval < self._min:
+                self._min = interval
+        self._last_tick = now
+
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self.report()
+            self._last_report = now
+
+    def get_stats(self):
+        '''
+        Returns period/jitter stats in ms for the current window
+        '''
+        if self._count == 0:
+            return {"count": 0, "mean_ms": 0.0, "jitter_ms": 0.0, "min_ms": 0.0, "max_ms": 0.0}
+        std = math.sqrt(self._m2 / self._count)
+        return {
+            "count": self._count,
+            "mean_ms": self._mean * 1000,
+            "jitter_ms": std * 1000,
+            "min_ms": self._min * 1000,
+            "max_ms": self._max * 1000,
+        }
+
+    def report(self):
+        stats = self.get_stats()
+        if stats["count"]:
+            logger.info(f"[{self.name}] period {stats['mean_ms']:.2f} ms, jitter {stats['jitter_ms']:.2f} ms, "
+                        f"min {stats['min_ms']:.2f} ms, max {stats['max_ms']:.2f} ms over {stats['count']} ticks")
+        self._reset()
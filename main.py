@@ -3,17 +3,28 @@ from core.framebuffer import FrameBuffer
 from core.image_processing import ImageProcessor
 from multiprocessing import Process, Event
 from core.processing_workers import process_frame
+from core.metrics import MetricsServer
+from utils.logger import start_queue_logging, stop_queue_logging
 import multiprocessing
 
 def main():
+    # all processes only enqueue log records, one listener thread writes them
+    start_queue_logging()
+
     frame_buffer = FrameBuffer()
     image_processor = ImageProcessor(frame_buffer)
     image_processor.start()
 
-    main_window = MainWindow()
+    # Prometheus text endpoint on http://127.0.0.1:9108/metrics
+    metrics_server = MetricsServer(frame_buffer.metrics)
+    metrics_server.start()
+
+    main_window = MainWindow(frame_buffer)
     main_window.run()
 
     image_processor.stop()
+    metrics_server.stop()
+    stop_queue_logging()
 
 
 
@@ -0,0 +1,78 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+
+import pytest
+
+pytest.importorskip("pypylon")
+os.environ["PYLON_CAMEMU"] = "1"
+
+from core.cam_manager import CamManager
+from core.framebuffer import FrameBuffer
+
+MAX_STOP_LATENCY_MS = 100
+# stop + close + open + start; opening dominates (about 250 ms on the emulator)
+MAX_SWITCH_LATENCY_MS = 1000
+# the GUI callback only starts the switch thread
+MAX_SWITCH_CALL_MS = 20
+
+
+def _wait_for_frames(frame_buffer, count, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while frame_buffer.raw_frame_ctr.value < count:
+        assert time.perf_counter() < deadline, "no frames from the emulated camera"
+        frame_buffer.get_raw_batch(timeout_ms=10)
+
+
+@pytest.fixture
+def cam():
+    cam = CamManager(FrameBuffer())
+    if not cam.list_cameras():
+        pytest.skip("no emulated camera available")
+    cam.connect(0)
+    yield cam
+    if cam.is_switching():
+        cam._switch_thread.join()
+    cam.disconnect()
+    # nobody consumes the raw queue here, don't block interpreter exit on it
+    cam.frame_buffer.raw_queue.cancel_join_thread()
+
+
+def test_stop_latency(cam):
+    cam.start_capture()
+    _wait_for_frames(cam.frame_buffer, 3)
+
+    cam.stop_capture()
+    print(f"stop latency: {cam.last_stop_latency_ms:.1f} ms")
+    assert not cam.is_capturing()
+    assert cam.last_stop_latency_ms < MAX_STOP_LATENCY_MS
+
+
+def test_switch_keeps_capturing(cam):
+    cam.start_capture()
+    _wait_for_frames(cam.frame_buffer, 3)
+
+    cam.switch_camera(0)
+    print(f"switch latency: {cam.last_switch_latency_ms:.1f} ms")
+    assert cam.is_capturing()
+    frames_before = cam.frame_buffer.raw_frame_ctr.value
+    _wait_for_frames(cam.frame_buffer, frames_before + 3)
+    assert cam.last_stop_latency_ms < MAX_STOP_LATENCY_MS
+    assert cam.last_switch_latency_ms < MAX_SWITCH_LATENCY_MS
+
+
+def test_switch_async_does_not_block(cam):
+    cam.start_capture()
+    _wait_for_frames(cam.frame_buffer, 3)
+
+    done = []
+    start = time.perf_counter()
+    assert cam.switch_camera_async(0, on_done=done.append)
+    call_ms = (time.perf_counter() - start) * 1000
+    cam._switch_thread.join(MAX_SWITCH_LATENCY_MS / 1000)
+    print(f"switch_camera_async returned in {call_ms:.1f} ms, switch took {cam.last_switch_latency_ms:.1f} ms")
+    assert call_ms < MAX_SWITCH_CALL_MS
+    assert done == [None]
+    assert cam.is_capturing()
+    assert cam.last_switch_latency_ms < MAX_SWITCH_LATENCY_MS
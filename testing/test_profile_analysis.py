@@ -0,0 +1,98 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import math
+
+import numpy as np
+import pytest
+
+from core.profile_analysis import ProfileSampler, analyze_profiles, find_edges, find_peaks
+
+# 2 * sqrt(2 * ln 2)
+FWHM_PER_SIGMA = 2.0 * math.sqrt(2.0 * math.log(2.0))
+
+
+def _gaussian(center, sigma, samples=101, height=1000.0, baseline=50.0):
+    x = np.arange(samples)
+    return (baseline + height * np.exp(-0.5 * ((x - center) / sigma) ** 2)).astype(np.float32)
+
+def _step(position, width=1.5, samples=101, low=100.0, high=900.0):
+    x = np.arange(samples)
+    return (low + (high - low) / (1.0 + np.exp(-(x - position) / width))).astype(np.float32)
+
+
+# the centroid window has to cover the feature (about +-3 sigma), a truncated one pulls
+# the position towards the sample with the maximum
+@pytest.mark.parametrize("method, sigma, window", [("parabolic", 4.0, 3), ("centroid", 1.5, 5)])
+def test_gaussian_peak_position_and_fwhm(method, sigma, window):
+    profiles = np.stack([_gaussian(40.3, sigma), _gaussian(60.7, 1.5 * sigma)])
+    peaks = find_peaks(profiles, method, window)
+    np.testing.assert_allclose(peaks["position"], [40.3, 60.7], atol=0.1)
+    # linear interpolation of the half-level crossings reads a few percent wide on narrow peaks
+    np.testing.assert_allclose(peaks["fwhm"], [sigma * FWHM_PER_SIGMA, 1.5 * sigma * FWHM_PER_SIGMA], rtol=0.03)
+    # the height is the highest sample, slightly below the true maximum between samples
+    np.testing.assert_allclose(peaks["height"], [1000.0, 1000.0], rtol=0.03)
+
+
+@pytest.mark.parametrize("method, window", [("parabolic", 3), ("centroid", 5)])
+def test_step_edge_position(method, window):
+    rising = _step(30.4, width=0.8)
+    falling = _step(70.6, width=0.8)[::-1].copy()   # falls at 100 - 70.6
+    positions, strengths = find_edges(np.stack([rising, falling]), "rising", method, window)
+    assert positions[0] == pytest.approx(30.4, abs=0.1)
+    assert strengths[0] > 0
+    # the falling profile has no rising edge
+    assert np.isnan(positions[1]) and np.isnan(strengths[1])
+    positions, strengths = find_edges(falling, "falling", method, window)
+    assert positions == pytest.approx(100 - 70.6, abs=0.1)
+    assert strengths < 0
+
+
+def test_flat_profile_has_no_edge():
+    positions, strengths = find_edges(np.full(50, 7.0), "both", "centroid")
+    assert np.isnan(positions) and np.isnan(strengths)
+    with pytest.raises(ValueError):
+        find_edges(np.full(50, 7.0), "both", "spline")
+
+
+def test_sampler_matches_analytic_image():
+    # horizontal and diagonal lines through a horizontal ramp, at subpixel coordinates
+    height, width = 40, 60
+    image = np.tile(np.arange(width, dtype=np.float32) * 2.0, (height, 1))
+    sampler = ProfileSampler([((5.5, 10.25), (45.5, 10.25)), ((10, 5), (40, 35))], (height, width), num_samples=11)
+    profiles = sampler.sample(image)
+    assert profiles.shape == (2, 11)
+    np.testing.assert_allclose(profiles[0], 2.0 * np.linspace(5.5, 45.5, 11), rtol=1e-5)
+    np.testing.assert_allclose(profiles[1], 2.0 * np.linspace(10, 40, 11), rtol=1e-5)
+
+
+def test_sampler_rgb_is_mean_of_channels():
+    rng = np.random.default_rng(1)
+    rgb = [rng.random((30, 50, 3), dtype=np.float32) for _ in range(3)]
+    sampler = ProfileSampler([((2.3, 4.7), (47.1, 25.2)), ((0, 0), (49, 0))], (30, 50))
+    expected = sampler.sample(np.stack([frame.mean(axis=-1) for frame in rgb]))
+    np.testing.assert_allclose(sampler.sample(rgb), expected, rtol=1e-5, atol=1e-6)
+    with pytest.raises(ValueError):
+        sampler.sample([np.zeros((31, 50), dtype=np.float32)])
+
+
+def test_lines_partly_off_the_image_are_invalid():
+    height, width = 40, 60
+    image = _gaussian(30.0, 3.0, samples=width)[None].repeat(height, axis=0)
+    lines = [
+        ((0, 20), (59, 20)),     # inside, touching both borders; one sample per pixel
+        ((-10, 20), (40, 20)),   # starts left of the image
+        ((10, 30), (40, 45)),    # leaves at the bottom
+    ]
+    sampler = ProfileSampler(lines, (height, width))
+    assert sampler.valid.tolist() == [True, False, False]
+    profiles = sampler.sample([image, image])
+    assert not np.isnan(profiles[:, 0]).any()
+    assert np.isnan(profiles[:, 1:]).all()
+
+    results = analyze_profiles(profiles, edge_method="centroid")
+    assert results["valid"].tolist() == [[True, False, False]] * 2
+    np.testing.assert_allclose(results["peak_position"][:, 0], 30.0, atol=0.1)
+    for key, value in results.items():
+        if key != "valid":
+            assert np.isnan(value[:, 1:]).all(), key
@@ -16,6 +16,7 @@ import threading
 from queue import Queue
 from core.framebuffer import FrameBuffer
 from core.image_processing import ImageProcessor
+from core.display_scheduler import DisplayScheduler
 
 logger = Logger(__name__)
 
@@ -23,13 +24,13 @@ logger = Logger(__name__)
 
 
 class MainWindow:
-    def __init__(self):
+    def __init__(self, frame_buffer=None, display_fps=None):
         dpg.create_context()
         dpg.create_viewport(title='Video Test', width=900, height=720)
         dpg.setup_dearpygui()
 
         
-        
+        self.frame_buffer = frame_buffer if frame_buffer is not None else FrameBuffer()
         self.cam = CamManager(self.frame_buffer)
       
 
@@ -44,22 +45,10 @@ class MainWindow:
         # Display configuration
         self.video_width = 2048     
         self.video_height = 1536
-        self.texture_data = np.zeros((self.video_height, self.video_width, 3), dtype=np.float32)
-        print(f"Frame info: ndim={self.texture_data.ndim}, shape={self.texture_data.shape}, dtype={self.texture_data.dtype}, size={self.texture_data.size}")
-        
-        # Threading for texture updates
-        self._texture_update_thread = None
-        self._stop_texture_update = threading.Event()
-        self._texture_lock = threading.Lock()
         
-        with dpg.texture_registry():
-            # Use raw texture for highest performance
-            self.texture = dpg.add_raw_texture(tag='texture',
-                width=self.video_width, 
-                height=self.video_height, 
-                default_value=self.texture_data, 
-                format=dpg.mvFormat_Float_rgb
-            )
+        # Newest-frame-only uploads from the render loop, double-buffered, optional fps cap
+        self.display = DisplayScheduler(self.frame_buffer, self.video_width, self.video_height, max_fps=display_fps)
+        self.texture = self.display.texture
 
         with dpg.window(label="Video Window", tag="MainWindow"):
 
@@ -74,7 +63,8 @@ class MainWindow:
                 dpg.add_plot_axis(dpg.mvYAxis, label="y", tag="y_axis")
                 
 
-                dpg.add_image_series('texture', bounds_min=(0, 0), bounds_max=(self.video_width, self.video_height), parent='y_axis', tag='image_series')
+                dpg.add_image_series(self.texture, bounds_min=(0, 0), bounds_max=(self.video_width, self.video_height), parent='y_axis', tag='image_series')
+                self.display.set_image_series('image_series')
                 #line_id = dpg.draw_line([0, 0], [self.video_width, self.video_height], color=[255, 0, 0])
                 self.roi_line = ROILine((50, 0), (50, self.video_height), (255, 0, 0))
 
@@ -97,29 +87,16 @@ class MainWindow:
             selected_label = app_data
             selected_index = self.camera_labels.index(selected_label)
             
-            # Stop current capture and disconnect if connected
-            if self.cam.is_capturing():
-                self.cam.stop_capture()
-            if self.cam.is_connected():
-                self.cam.disconnect()
-            
-            # Connect to new camera
-            self.cam.connect(selected_index)
-            logger.info(f"Connected to camera {selected_index}")
+            # Stops the current camera (in ms), connects the new one and resumes capture if it was running.
+            # Opening a camera takes a while, so this runs off the render thread
+            if self.cam.switch_camera_async(selected_index):
+                logger.info(f"Switching to camera {selected_index}")
             
         except ValueError:
             logger.error("Could not retrieve camera index from combobox selection.")
         except Exception as e:
             logger.error(f"Error connecting to camera: {e}")
 
-    def _texture_update_worker(self):      
-        while not self._stop_texture_update.is_set():
-            if self.frame_buffer.is_data_available():
-                seq_num, processed_frame = self.frame_buffer.get_processed_frame()
-                dpg.set_value(self.texture, processed_frame)
-            else:
-                time.sleep(0.1)
-            
     def start_button_callback(self, sender, app_data):
         if sender == self.start_capture_button:
             self.cam.start_capture()
@@ -130,36 +107,11 @@ class MainWindow:
             self.image_processor.stop()
             logger.info("Stopped capture and image processing")
       
-    def start_texture_update_thread(self):
-        """
-        Start the texture update daemon thread
-        """
-        if self._texture_update_thread is None or not self._texture_update_thread.is_alive():
-            self._stop_texture_update.clear()
-            self._texture_update_thread = threading.Thread(
-                target=self._texture_update_worker, 
-                daemon=True,
-                name="TextureUpdateThread"
-            )
-            self._texture_update_thread.start()
-            logger.info("Started texture update daemon thread")
-
-    def stop_texture_update_thread(self):
-        """
-        Stop the texture update daemon thread
-        """
-        if self._texture_update_thread and self._texture_update_thread.is_alive():
-            self._stop_texture_update.set()
-            self._texture_update_thread.join(timeout=1.0)  # 1 second timeout
-            logger.info("Stopped texture update daemon thread")
-
     def cleanup(self):
         """
         Cleanup resources when closing
         """
         try:
-            # Stop texture update thread
-            self.stop_texture_update_thread()
             # Stop image processing thread
             self.image_processor.stop()
             # Stop capture
@@ -174,11 +126,9 @@ class MainWindow:
     def run(self):
         dpg.show_viewport()
         
-        # Start the texture update daemon thread
-        self.start_texture_update_thread()
-        
         while dpg.is_dearpygui_running():
-            # Render the frame - texture updates are now handled in background thread
+            # Upload the newest processed frame (if any) right before rendering it
+            self.display.update()
             dpg.render_dearpygui_frame()
             
         # Cleanup before destroying context
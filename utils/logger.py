@@ -1,10 +1,20 @@
 import logging
+import logging.handlers
+import multiprocessing
+import threading
+import time
+from queue import Empty, Full
 from colorama import Fore, Style, init as colorama_init
 
 # Global logging configuration
 GLOBAL_LOG_LEVEL = logging.INFO  # Default global level
 GLOBAL_HANDLERS = []  # Store global handlers
 
+LOG_FORMAT = '[%(asctime)s] - [%(name)s] - [%(levelname)s] - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_log_listener = None  # LogListener of this process, see start_queue_logging()
+
 def set_global_log_level(level):
     """Set the global logging level for all loggers"""
     global GLOBAL_LOG_LEVEL
@@ -93,10 +103,7 @@ class Logger:
         self.logger.setLevel(logging.INFO)
         self.console_handler = logging.StreamHandler()
         #self.console_handler.setLevel(logging.INFO)  # Explicitly set handler level
-        self.formatter = ColorFormatter(
-            '[%(asctime)s] - [%(name)s] - [%(levelname)s] - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+        self.formatter = ColorFormatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
         self.console_handler.setFormatter(self.formatter)
         # Ensure no duplicate handlers
         if not self.logger.hasHandlers():
@@ -122,3 +129,229 @@ class Logger:
     def critical(self, msg, *args, **kwargs):
         self.logger.critical(msg, *args, **kwargs)
 
+
+# ---- non-blocking multiprocess logging ----
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records without ever blocking; records are dropped (and counted) if the queue is full.
+    Repeats of a record (same logger, level and message) within dedup_window seconds are only
+    counted here, so the logging thread does not pay for formatting and pickling them; the count
+    is sent once the window has passed and the LogListener writes it as a summary.
+    """
+    def __init__(self, queue, dedup_window=1.0):
+        super().__init__(queue)
+        self.dropped = 0
+        self.dedup_window = dedup_window
+        self._windows = {}  # dedup_key -> [window start, suppressed count, first record]
+        self._windows_lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._timer = None
+
+    def emit(self, record):
+        if self.dedup_window > 0 and self._suppress(record):
+            return
+        super().emit(record)
+
+    def _suppress(self, record):
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        expired = []
+        with self._windows_lock:
+            if now - self._last_sweep >= self.dedup_window:
+                expired = self._pop_expired(now)
+            window = self._windows.get(key)
+            if window is not None and now - window[0] >= self.dedup_window:
+                # window is over: send its count, this record starts a new one
+                if window[1]:
+                    expired.append((window[2], window[1]))
+                window = None
+            if window is not None:
+                window[1] += 1
+                if self._timer is None:
+                    # send the count even if nothing else is logged afterwards
+                    self._timer = threading.Timer(self.dedup_window, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+            else:
+                self._windows[key] = [now, 0, record]
+        self._send_summaries(expired)
+        return window is not None
+
+    def _pop_expired(self, now, force=False):
+        # called with _windows_lock held
+        self._last_sweep = now
+        expired = []
+        for key, (start, suppressed, record) in list(self._windows.items()):
+            if force or now - start >= self.dedup_window:
+                del self._windows[key]
+                if suppressed:
+                    expired.append((record, suppressed))
+        return expired
+
+    def _on_timer(self):
+        with self._windows_lock:
+            self._timer = None
+            expired = self._pop_expired(time.monotonic())
+            if self._windows and any(window[1] for window in self._windows.values()):
+                self._timer = threading.Timer(self.dedup_window, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        self._send_summaries(expired)
+
+    def _send_summaries(self, expired):
+        for record, suppressed in expired:
+            summary = logging.makeLogRecord(record.__dict__)
+            summary.exc_info = None
+            summary.exc_text = None
+            summary.suppressed = suppressed
+            try:
+                self.enqueue(self.prepare(summary))
+            except Exception:
+                self.handleError(summary)
+
+    def flush(self):
+        with self._windows_lock:
+            expired = self._pop_expired(time.monotonic(), force=True)
+        self._send_summaries(expired)
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def prepare(self, record):
+        # dedup key for the listener, which also merges repeats coming from several processes
+        record.dedup_key = (record.name, record.levelno, record.getMessage())
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class LogListener:
+    """
+    Single consumer of the log queue: formats and writes all records on its own thread.
+    Repeated records (same logger, level and message) within dedup_window seconds are
+    written once, followed by a summary like "Raw queue is full ×312 in last 1 s".
+    """
+    def __init__(self, queue, handlers, dedup_window=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.dedup_window = dedup_window
+        self._windows = {}  # dedup_key -> [window start, suppressed count, first record]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="LogListener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=2.0)
+        self._flush_windows(force=True)
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=min(self.dedup_window, 0.25))
+            except Empty:
+                record = False
+            except (EOFError, OSError):
+                break
+            if record is None:
+                break
+            if record:
+                self._handle(record)
+            self._flush_windows()
+
+    def _handle(self, record):
+        key = getattr(record, "dedup_key", None)
+        # repeats already counted by the sending NonBlockingQueueHandler
+        suppressed = getattr(record, "suppressed", 0)
+        if key is not None and self.dedup_window > 0:
+            window = self._windows.get(key)
+            if window is not None:
+                window[1] += suppressed or 1
+                return
+            self._windows[key] = [time.monotonic(), suppressed, record]
+            if suppressed:
+                return
+        elif suppressed:
+            record.msg = f"{record.msg} ×{suppressed}"
+        self._emit(record)
+
+    def _flush_windows(self, force=False):
+        now = time.monotonic()
+        for key, (start, suppressed, record) in list(self._windows.items()):
+            if force or now - start >= self.dedup_window:
+                del self._windows[key]
+                if suppressed:
+                    summary = logging.makeLogRecord(record.__dict__)
+                    summary.msg = f"{record.msg} ×{suppressed} in last {self.dedup_window:g} s"
+                    summary.suppressed = 0
+                    summary.args = None
+                    summary.created = time.time()
+                    self._emit(summary)
+
+    def _emit(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def _install_handlers(handlers):
+    global GLOBAL_HANDLERS
+    GLOBAL_HANDLERS = handlers
+    for logger_name, logger in logging.Logger.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger) and logger.handlers:
+            logger.handlers.clear()
+            for handler in handlers:
+                logger.addHandler(handler)
+
+def start_queue_logging(maxsize=10000, dedup_window=1.0):
+    """
+    Switch this process to queue-based logging: every logger only enqueues records,
+    one LogListener thread formats and writes them to the console.
+    Returns the log queue; pass it to worker processes (configure_worker_logging).
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener.queue
+
+    colorama_init(autoreset=True)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ColorFormatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    log_queue = multiprocessing.Queue(maxsize=maxsize)
+    _log_listener = LogListener(log_queue, [console_handler], dedup_window=dedup_window)
+    _log_listener.start()
+    _install_handlers([NonBlockingQueueHandler(log_queue, dedup_window=dedup_window)])
+    return log_queue
+
+def stop_queue_logging():
+    """Flush and stop the log listener of this process"""
+    global _log_listener
+    if _log_listener is not None:
+        # counts of repeats still held by this process' handlers
+        for handler in GLOBAL_HANDLERS:
+            handler.flush()
+        _log_listener.stop()
+        _log_listener = None
+
+def get_log_queue():
+    """Returns the active log queue or None if queue logging is not enabled"""
+    if _log_listener is not None:
+        return _log_listener.queue
+    if GLOBAL_HANDLERS and isinstance(GLOBAL_HANDLERS[0], NonBlockingQueueHandler):
+        return GLOBAL_HANDLERS[0].queue
+    return None
+
+def configure_worker_logging(log_queue):
+    """Route all logging of a worker process into the main process' log queue"""
+    if log_queue is not None:
+        _install_handlers([NonBlockingQueueHandler(log_queue)])
+